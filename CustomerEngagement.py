@@ -1,18 +1,22 @@
 import streamlit as st # type: ignore
-import pandas as pd
 import plotly.express as px # type: ignore
+from data_loader import LOG_COLUMNS
+from query_backend import get_backend, unique_customers
+from figures import px_figure
+from data_viewer import raw_data_viewer
+from export import export_button
+from instrumentation import mark
+from funnels import DEFAULT_GAP, FUNNELS, SESSION_GAPS, get_funnel
+from ip_index import get_network_traffic
 
-# Load dataset
-@st.cache_data
-def load_data():
-    df = pd.read_csv('ai_solutions_web_sales_logs.csv', parse_dates=['date_of_sale'], dayfirst=True)
-    return df
-
-df = load_data()
+mark("Load data")
+# KPIs and charts are roll-ups from the query backend (see query_backend.py)
+backend = get_backend()
 
 st.markdown("# Customer Engagement 🗨️")
 st.sidebar.markdown("# Customer Engagement 🗨️")
 
+mark("Sidebar filters")
 # Sidebar filters with "Select All" functionality
 st.sidebar.header("Filters")
 st.sidebar.write("Select filters to customize the data view. For example, choose a country or salesperson.")
@@ -34,117 +38,220 @@ def multiselect_with_select_all(label, options, default):
         selected = st.sidebar.multiselect(label, options, default=[], key=label)
     return selected
 
+# Filter options are the values in the log, from the query backend
+country_options = list(backend.rollup('customer_country').index)
 customer_country = multiselect_with_select_all(
     "Customer Country",
-    options=df['customer_country'].unique(),
-    default=df['customer_country'].unique()
+    options=country_options,
+    default=country_options
 )
 
-filtered_data = df[
-    (df['customer_country'].isin(customer_country))
-]
+filters = {'customer_country': customer_country}
+
+mark("Aggregates")
+engagement_type_counts = backend.ranked('customer_interaction', 'count', filters)
 
+mark("KPIs")
 # KPIs
 kpi1, kpi2, kpi3 = st.columns(3)
 with kpi1:
-    st.metric("Total Engagements", filtered_data.shape[0])
+    st.metric("Total Engagements", int(engagement_type_counts.sum()))
 with kpi2:
-    st.metric("Unique Customers", filtered_data['ip_address'].nunique())
+    st.metric("Unique Customers", unique_customers(filters))
 with kpi3:
-    st.metric("Engagement Types", filtered_data['customer_interaction'].nunique())
+    st.metric("Engagement Types", len(engagement_type_counts))
 
+mark("Engagement over time")
 # Engagement Over Time (Monthly)
 # st.header("Engagements Over Time")
 engagements_over_time = (
-    filtered_data
-    .set_index('date_of_sale')
-    .resample('M')['customer_interaction']
-    .count()
+    backend.monthly_series('count', filters)
+    .rename('customer_interaction')
+    .rename_axis('date_of_sale')
     .reset_index()
 )
 engagements_over_time['month'] = engagements_over_time['date_of_sale'].dt.strftime('%Y-%m')
 
-fig1 = px.line(
+fig1 = px_figure(
+    'line',
     engagements_over_time,
     x='month',
     y='customer_interaction',
     markers=True,
     labels={'customer_interaction': 'Number of Engagements', 'month': 'Month'},
-    title='Engagements Over Time'
+    title='Engagements Over Time',
+    layout=dict(xaxis_tickangle=-45)
 )
-fig1.update_layout(xaxis_tickangle=-45)
 st.plotly_chart(fig1, use_container_width=True)
 
+mark("Engagement by type")
 # Engagement by Type
 Sec1, Sec2 = st.columns([2, 2.5])
 with Sec1:
     # st.subheader("Engagement by Type")
-    engagement_type_counts = filtered_data['customer_interaction'].value_counts()
-    fig2 = px.pie(
+    fig2 = px_figure(
+        'pie',
         names=engagement_type_counts.index,
         values=engagement_type_counts.values,
         title="Engagement by Type",
         hole=0.4,
-        color_discrete_sequence=px.colors.sequential.Viridis
+        color_discrete_sequence=px.colors.sequential.Viridis,
+        traces=dict(textinfo='percent+label', textfont_size=14)
     )
-    fig2.update_traces(textinfo='percent+label', textfont_size=14)
     st.plotly_chart(fig2, use_container_width=True)
 
 with Sec2:
     # st.subheader("Top Countries by Engagement")
-    country_engagement = filtered_data['customer_country'].value_counts().head(10)
-    fig3 = px.bar(
+    country_engagement = backend.ranked('customer_country', 'count', filters).head(10)
+    fig3 = px_figure(
+        'bar',
         x=country_engagement.values,
         y=country_engagement.index,
         orientation='h',
         labels={'x': 'Number of Engagements', 'y': 'Country'},
         color=country_engagement.values,
         color_continuous_scale='viridis',
-        title="Top Countries by Engagement"
+        title="Top Countries by Engagement",
+        layout=dict(yaxis={'categoryorder':'total ascending'})
     )
-    fig3.update_layout(yaxis={'categoryorder':'total ascending'})
     st.plotly_chart(fig3, use_container_width=True)
     
     
+mark("Engagement breakdowns")
 Col1, Col2 = st.columns([2, 2])
 
 with Col1:
     # Engagement by Product (using Plotly)
     # st.header("Engagement by Product")
-    product_engagement = (
-        filtered_data.groupby('product_sold')['customer_interaction']
-        .count()
-        .sort_values(ascending=False)
-    )
-    fig4 = px.bar(
+    product_engagement = backend.ranked('product_sold', 'count', filters)
+    fig4 = px_figure(
+        'bar',
         x=product_engagement.index,
         y=product_engagement.values,
         labels={'x': 'Product', 'y': 'Number of Engagements'},
         color=product_engagement.values,
         color_continuous_scale='viridis',
-        title="Engagement by Product"
+        title="Engagement by Product",
+        layout=dict(xaxis_tickangle=-45)
     )
-    fig4.update_layout(xaxis_tickangle=-45)
     st.plotly_chart(fig4, use_container_width=True)
 
 with Col2:
     # Engagement by Job Type (using Plotly)
-    if 'job_type_requested' in filtered_data.columns:
+    if 'job_type_requested' in LOG_COLUMNS:
         # st.header("Engagement by Job Type")
-        job_engagement = filtered_data['job_type_requested'].value_counts()
-        fig5 = px.bar(
+        job_engagement = backend.ranked('job_type_requested', 'count', filters)
+        fig5 = px_figure(
+            'bar',
             x=job_engagement.index,
             y=job_engagement.values,
             labels={'x': 'Job Type', 'y': 'Number of Engagements'},
             color=job_engagement.values,
             color_continuous_scale='viridis',
-            title="Engagement by Job Type"
+            title="Engagement by Job Type",
+            layout=dict(xaxis_tickangle=-45)
         )
-        fig5.update_layout(xaxis_tickangle=-45)
         st.plotly_chart(fig5, use_container_width=True)
 
+mark("Conversion funnels")
+# Conversion funnels: per-IP sessions moving from one url to the next (see funnels.py).
+# The section has its own widgets, so it reruns as a fragment.
+@st.fragment
+def funnel_section(filters):
+    st.header("Conversion Funnels")
+    funnel_col, gap_col = st.columns(2)
+    with funnel_col:
+        funnel_name = st.selectbox("Funnel", list(FUNNELS), key="funnel_name")
+    with gap_col:
+        gap = st.selectbox(
+            "Session gap",
+            list(SESSION_GAPS),
+            index=list(SESSION_GAPS).index(DEFAULT_GAP),
+            key="funnel_gap",
+            help="Requests from one IP address further apart than this start a new session."
+        )
+    stages, cohorts = get_funnel(funnel_name, filters, gap)
+
+    Fun1, Fun2 = st.columns([2, 3])
+    with Fun1:
+        fig6 = px_figure(
+            'funnel',
+            stages,
+            x='sessions',
+            y='stage',
+            title=f"{funnel_name} Funnel",
+            labels={'sessions': 'Sessions', 'stage': 'Stage'}
+        )
+        st.plotly_chart(fig6, use_container_width=True)
+        st.dataframe(
+            stages.rename(columns={
+                'stage': 'Stage',
+                'sessions': 'Sessions',
+                'step_conversion': 'From Previous (%)',
+                'overall_conversion': 'From Entry (%)'
+            }).round(2),
+            hide_index=True
+        )
+    with Fun2:
+        fig7 = px_figure(
+            'bar',
+            cohorts,
+            x='month',
+            y='conversion',
+            hover_data=['entered', 'completed'],
+            labels={'month': 'Entry Month', 'conversion': 'Completed (%)', 'entered': 'Entered', 'completed': 'Completed'},
+            title="Funnel Completion by Monthly Cohort"
+        )
+        st.plotly_chart(fig7, use_container_width=True)
+
+funnel_section(filters)
+
+mark("Network traffic")
+# Requests and customers per network from the IP range index (see ip_index.py).
+@st.fragment
+def network_section(filters):
+    st.header("Traffic by Network")
+    net_col, bits_col = st.columns([3, 1])
+    with net_col:
+        network = st.text_input(
+            "Network",
+            key="traffic_network",
+            placeholder="e.g. 157.20. or 10.0.0.0/8",
+            help="A dotted prefix or CIDR block; leave empty for all addresses."
+        )
+    with bits_col:
+        subnet = st.selectbox("Subnet size", ["/8", "/16", "/24", "/32"], index=2, key="traffic_bits")
+    bits = int(subnet[1:])
+    try:
+        networks, subnets = get_network_traffic(filters, network.strip(), bits)
+    except ValueError as error:
+        st.error(str(error))
+        return
+
+    Net1, Net2 = st.columns(2)
+    with Net1:
+        fig8 = px_figure(
+            'bar',
+            networks,
+            x='network',
+            y=['requests', 'customers'],
+            barmode='group',
+            labels={'network': 'Network', 'value': 'Count', 'variable': 'Metric'},
+            title="Internal vs. External Traffic"
+        )
+        st.plotly_chart(fig8, use_container_width=True)
+    with Net2:
+        st.subheader(f"Busiest /{bits} Subnets")
+        st.dataframe(
+            subnets.rename(columns={'subnet': 'Subnet', 'requests': 'Requests', 'customers': 'Unique Customers'}),
+            hide_index=True
+        )
+
+network_section(filters)
+
+mark("Raw data and export")
 # Show raw data
 with st.expander("Show Raw Engagement Data"):
-    st.dataframe(filtered_data)
-    st.download_button("Export Data as CSV", data=filtered_data.to_csv(index=False), file_name="filtered_data.csv")
+    raw_data_viewer(filters, key="engagement_raw")
+    export_button(filters, key="engagement_export")
 
@@ -1,18 +1,19 @@
 import streamlit as st # type: ignore
-import pandas as pd
 import plotly.express as px # type: ignore
 import time
+from data_loader import LOG_COLUMNS
+from query_backend import get_backend, latest_rows, unique_customers
+from figures import px_figure
+from export import export_button
+from instrumentation import mark
+from ip_index import format_ips
 
-# Load dataset
-@st.cache_data
-def load_data():
-    df = pd.read_csv('ai_solutions_web_sales_logs.csv', parse_dates=['timestamp', 'date_of_sale'], dayfirst=True)
-    return df
-
+mark("Load data")
 start = time.time()
 # Load data with a spinner
 with st.spinner("Loading data..."):
-    df = load_data()
+    # KPIs and charts are roll-ups from the query backend (see query_backend.py)
+    backend = get_backend()
 end = time.time()
 Loading_time = end - start
 st.success("Data loaded successfully! Loaded Data in: {:.2f} seconds 🥳".format(Loading_time))
@@ -20,6 +21,7 @@ st.success("Data loaded successfully! Loaded Data in: {:.2f} seconds 🥳".forma
 st.markdown("# Job Types & Requests ❄️")
 st.sidebar.markdown("# Job Types & Requests ❄️")
 
+mark("Sidebar filters")
 # Sidebar filters with "Select All" functionality
 st.sidebar.header("Filters")
 st.sidebar.write("Select filters to customize the data view. For example, choose a country or salesperson.")
@@ -41,120 +43,126 @@ def multiselect_with_select_all(label, options, default):
         selected = st.sidebar.multiselect(label, options, default=[], key=label)
     return selected
 
+# Filter options are the values in the log, from the query backend
+country_options = list(backend.rollup('customer_country').index)
 customer_country = multiselect_with_select_all(
     "Customer Country",
-    options=df['customer_country'].unique(),
-    default=df['customer_country'].unique()
+    options=country_options,
+    default=country_options
 )
 
-# Apply filters
-filtered_data = df[
-    (df['customer_country'].isin(customer_country))
-]
+filters = {'customer_country': customer_country}
 
+mark("KPIs")
 # --- KPIs ---
 col1, col2, col3 = st.columns(3)
 with col1:
-    st.metric("Total Requests", filtered_data.shape[0])
+    st.metric("Total Requests", int(backend.total(filters)['count']))
 with col2:
-    unique_customers = filtered_data['ip_address'].nunique() if 'ip_address' in filtered_data.columns else 0
-    st.metric("Unique Customers", unique_customers)
+    st.metric("Unique Customers", unique_customers(filters) if 'ip_address' in LOG_COLUMNS else 0)
 with col3:
-    unique_job_types = filtered_data['job_type_requested'].nunique() if 'job_type_requested' in filtered_data.columns else 0
+    unique_job_types = len(backend.rollup('job_type_requested', filters)) if 'job_type_requested' in LOG_COLUMNS else 0
     st.metric("Distinct Job Types Requested", unique_job_types)
     
 
+mark("Job type charts")
 Section1, Section2 = st.columns([1.69,2.31])
 with Section1:
     # --- Donut Chart: Distribution of Job Types Requested (Plotly) ---
     # st.subheader("Distribution of Job Types Requested")
-    if 'job_type_requested' in filtered_data.columns:
-        job_counts = filtered_data[filtered_data['job_type_requested'] != 'N/A']['job_type_requested'].value_counts().reset_index()
+    if 'job_type_requested' in LOG_COLUMNS:
+        job_counts = backend.ranked('job_type_requested', 'count', filters).drop(index='N/A', errors='ignore').reset_index()
         job_counts.columns = ['job_type_requested', 'count']
-        fig_donut = px.pie(
+        fig_donut = px_figure(
+            'pie',
             job_counts,
             names='job_type_requested',
             values='count',
             title="Distribution of Job Types Requested",
             color_discrete_sequence=px.colors.sequential.Viridis,
-            hole=0.5  # This makes it a donut chart
+            hole=0.5,  # This makes it a donut chart
+            traces=dict(textinfo='percent+label')
         )
-        fig_donut.update_traces(textinfo='percent+label')
         st.plotly_chart(fig_donut, use_container_width=True)
 
 with Section2:
     # --- Interactive Line Chart: Monthly Requests Over Time ---
     # st.subheader("Monthly Requests Over Time")
-    if 'timestamp' in filtered_data.columns:
-        time_data = filtered_data.copy()
-        time_data['month'] = pd.to_datetime(time_data['timestamp']).dt.to_period('M').dt.to_timestamp()
-        requests_over_month = time_data.groupby('month').size().reset_index(name='num_requests')
-        fig_line = px.line(
+    if 'timestamp' in LOG_COLUMNS:
+        # Requests are logged at the time of sale, so the sale month is the request month
+        requests_over_month = backend.rollup('month', filters)['count'].reset_index(name='num_requests')
+        fig_line = px_figure(
+            'line',
             requests_over_month,
             x='month',
             y='num_requests',
             markers=True,
             title="Monthly Requests Over Time",
             labels={'month': 'Month', 'num_requests': 'Number of Requests'},
-            hover_data={'month': True, 'num_requests': True}
+            hover_data={'month': True, 'num_requests': True},
+            traces=dict(hovertemplate='Month: %{x|%b %Y}<br>Requests: %{y}'),
+            layout=dict(xaxis_tickformat='%b %Y')
         )
-        fig_line.update_traces(hovertemplate='Month: %{x|%b %Y}<br>Requests: %{y}')
-        fig_line.update_layout(xaxis_tickformat='%b %Y')
         st.plotly_chart(fig_line, use_container_width=True)
     else:
         st.warning("The 'timestamp' column is missing from the dataset.")
 
+mark("Demo and event charts")
 # --- Bar Charts: Job Types Requested & Scheduled Demos/Events (Side by Side) ---
 st.subheader("Job Types & Scheduled Demos/Events")
 colA, colB = st.columns(2)
 
 with colA:
     # st.markdown("**Job Types Requested**")
-    if 'job_type_requested' in filtered_data.columns:
-        job_data = filtered_data[filtered_data['job_type_requested'] != 'N/A']
-        job_counts = job_data['job_type_requested'].value_counts().reset_index()
+    if 'job_type_requested' in LOG_COLUMNS:
+        job_counts = backend.ranked('job_type_requested', 'count', filters).drop(index='N/A', errors='ignore').reset_index()
         job_counts.columns = ['job_type_requested', 'count']
-        fig3 = px.bar(
+        fig3 = px_figure(
+            'bar',
             job_counts,
             x='job_type_requested',
             y='count',
             color='count',
             color_continuous_scale='viridis',
             labels={'job_type_requested': 'Job Type', 'count': 'Number of Requests'},
-            title="Job Types Requested"
+            title="Job Types Requested",
+            layout=dict(xaxis_tickangle=-45)
         )
-        fig3.update_layout(xaxis_tickangle=-45)
         st.plotly_chart(fig3, use_container_width=True)
     else:
         st.error("The 'job_type_requested' column is missing from the dataset.")
 
 with colB:
     # st.markdown("**Scheduled Demos and Promotional Events Requests**")
-    if 'customer_interaction' in filtered_data.columns:
-        demo_events = filtered_data[filtered_data['customer_interaction'].str.contains('Demo|Event', case=False, na=False)]
-        demo_counts = demo_events['customer_interaction'].value_counts().reset_index()
+    if 'customer_interaction' in LOG_COLUMNS:
+        interaction_counts = backend.ranked('customer_interaction', 'count', filters)
+        demo_counts = interaction_counts[interaction_counts.index.str.contains('Demo|Event', case=False, na=False)].reset_index()
         demo_counts.columns = ['interaction_type', 'count']
-        fig4 = px.bar(
+        fig4 = px_figure(
+            'bar',
             demo_counts,
             x='interaction_type',
             y='count',
             color='count',
             color_continuous_scale='viridis',
             labels={'interaction_type': 'Interaction Type', 'count': 'Number of Requests'},
-            title="Scheduled Demos and Promotional Events Requests"
+            title="Scheduled Demos and Promotional Events Requests",
+            layout=dict(xaxis_tickangle=-45)
         )
-        fig4.update_layout(xaxis_tickangle=-45)
         st.plotly_chart(fig4, use_container_width=True)
     else:
         st.error("The 'customer_interaction' column is missing from the dataset.")
 
+mark("AI assistant requests")
 # --- Requests for AI-powered Virtual Assistant ---
 st.header("Requests for AI-powered Virtual Assistant")
-if 'customer_interaction' in filtered_data.columns:
-    ai_requests = filtered_data[filtered_data['customer_interaction'].str.contains('AI Assistant', case=False, na=False)]
-    st.write(f"Total AI Assistant Requests: {ai_requests.shape[0]}")
-    st.dataframe(ai_requests[['timestamp', 'ip_address', 'customer_country', 'salesperson']].sort_values(by='timestamp', ascending=False).head(10))
+if 'customer_interaction' in LOG_COLUMNS:
+    ai_interactions = [value for value in backend.rollup('customer_interaction').index if 'ai assistant' in value.lower()]
+    ai_filters = {**filters, 'customer_interaction': ai_interactions}
+    st.write(f"Total AI Assistant Requests: {int(backend.total(ai_filters)['count'])}")
+    st.dataframe(format_ips(latest_rows(['timestamp', 'ip_address', 'customer_country', 'salesperson'], 10, ai_filters)))
 else:
     st.warning("The 'customer_interaction' column is missing from the dataset.")
     
-st.download_button("Export Data as CSV", data=filtered_data.to_csv(index=False), file_name="filtered_data.csv")
\ No newline at end of file
+mark("Export")
+export_button(filters, key="jobs_export")
\ No newline at end of file
@@ -1,20 +1,19 @@
 import streamlit as st # type: ignore
-import pandas as pd
-import plotly.express as px # type: ignore
-from geopy.geocoders import Nominatim # type: ignore
+from query_backend import get_backend
+from figures import px_figure
+from data_viewer import raw_data_viewer
+from export import export_button
+from instrumentation import mark
+from geocode import add_latlon
 
-
-# Load dataset
-@st.cache_data
-def load_data():
-    df = pd.read_csv('ai_solutions_web_sales_logs.csv', parse_dates=['date_of_sale'], dayfirst=True)
-    return df
-
-df = load_data()
+mark("Load data")
+# KPIs and charts are roll-ups from the query backend (see query_backend.py)
+backend = get_backend()
 
 st.markdown("# Location Analysis 📍")
 st.sidebar.markdown("# Location Analysis 📍")
 
+mark("Sidebar filters")
 # Sidebar filters with "Select All" functionality
 st.sidebar.header("Filters")
 st.sidebar.write("Select filters to customize the data view. For example, choose a country or salesperson.")
@@ -36,56 +35,66 @@ def multiselect_with_select_all(label, options, default):
         selected = st.sidebar.multiselect(label, options, default=[], key=label)
     return selected
 
+# Filter options are the values in the log, from the query backend
+country_options = list(backend.rollup('customer_country').index)
 customer_country = multiselect_with_select_all(
     "Customer Country",
-    options=df['customer_country'].unique(),
-    default=df['customer_country'].unique()
+    options=country_options,
+    default=country_options
 )
 
-filtered_data = df[df['customer_country'].isin(customer_country)]
+filters = {'customer_country': customer_country}
+
+mark("Aggregates")
+totals = backend.total(filters)
 
+mark("KPIs")
 # KPIs
 kpi1, kpi2, kpi3 = st.columns(3)
 with kpi1:
-    st.metric("Total Revenue", f"${filtered_data['cost'].sum():,.2f}")
+    st.metric("Total Revenue", f"${totals['cost']:,.2f}")
 with kpi2:
-    st.metric("Countries", filtered_data['customer_country'].nunique())
+    st.metric("Countries", len(backend.rollup('customer_country', filters)))
 with kpi3:
-    st.metric("Total Transactions", filtered_data.shape[0])
+    st.metric("Total Transactions", int(totals['count']))
 
 
+mark("Country charts")
 Col1, Col2 = st.columns(2)
 with Col1:
     # Revenue by Country
     st.header("Revenue by Country")
-    revenue_by_country = filtered_data.groupby('customer_country')['cost'].sum().sort_values(ascending=False)
-    fig1 = px.bar(
+    revenue_by_country = backend.revenue_by('customer_country', filters)
+    fig1 = px_figure(
+        'bar',
         revenue_by_country,
         x=revenue_by_country.values,
         y=revenue_by_country.index,
         orientation='h',
         labels={'x': 'Revenue', 'y': 'Country'},
         color=revenue_by_country.values,
-        color_continuous_scale='viridis'
+        color_continuous_scale='viridis',
+        layout=dict(yaxis={'categoryorder':'total ascending'}, height=400)
     )
-    fig1.update_layout(yaxis={'categoryorder':'total ascending'}, height=400)
     st.plotly_chart(fig1, use_container_width=True)
 with Col2:
     # Engagements by Country
     st.header("Engagements by Country")
-    engagements_by_country = filtered_data['customer_country'].value_counts()
-    fig2 = px.bar(
+    engagements_by_country = backend.ranked('customer_country', 'count', filters)
+    fig2 = px_figure(
+        'bar',
         engagements_by_country,
         x=engagements_by_country.values,
         y=engagements_by_country.index,
         orientation='h',
         labels={'x': 'Number of Engagements', 'y': 'Country'},
         color=engagements_by_country.values,
-        color_continuous_scale='viridis'
+        color_continuous_scale='viridis',
+        layout=dict(yaxis={'categoryorder':'total ascending'}, height=400)
     )
-    fig2.update_layout(yaxis={'categoryorder':'total ascending'}, height=400)
     st.plotly_chart(fig2, use_container_width=True)
 
+mark("Map and salesperson charts")
 Part1, Part2 = st.columns(2)
 with Part1:
     # Top Products by Selected Country
@@ -100,17 +109,18 @@ with Part1:
 
     if selected_country:
         st.subheader(f"{selected_country}")
-        prod_counts = filtered_data[filtered_data['customer_country'] == selected_country]['product_sold'].value_counts()
+        prod_counts = backend.ranked('product_sold', 'count', {'customer_country': [selected_country]})
         if not prod_counts.empty:
-            fig = px.bar(
+            fig = px_figure(
+                'bar',
                 prod_counts,
                 x=prod_counts.index,
                 y=prod_counts.values,
                 labels={'x': 'Product', 'y': 'Count'},
                 color=prod_counts.values,
-                color_continuous_scale='viridis'
+                color_continuous_scale='viridis',
+                layout=dict(xaxis_tickangle=45, height=300)
             )
-            fig.update_layout(xaxis_tickangle=45, height=300)
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No product data available for this country.")
@@ -118,29 +128,19 @@ with Part1:
 with Part2:
     # Location Insights Map using customer_country
     st.header("Customer Locations Map")
-    # Use pycountry and pycountry_convert to get approximate lat/lon for each country
+    # Approximate lat/lon for each country from the bundled gazetteer
 
-    country_counts = filtered_data['customer_country'].value_counts().reset_index()
+    country_counts = backend.ranked('customer_country', 'count', filters).reset_index()
     country_counts.columns = ['country', 'count']
-
-    geolocator = Nominatim(user_agent="country_locator")
-    def get_country_latlon(country):
-        try:
-            location = geolocator.geocode(country)
-            if location:
-                return pd.Series({'lat': location.latitude, 'lon': location.longitude})
-        except Exception:
-            pass
-        return pd.Series({'lat': None, 'lon': None})
-
-    country_counts[['lat', 'lon']] = country_counts['country'].apply(get_country_latlon)
+    country_counts = add_latlon(country_counts)
     map_df = country_counts.dropna(subset=['lat', 'lon'])
     if not map_df.empty:
         st.map(map_df[['lat', 'lon', 'count']])
     else:
         st.warning("Could not geocode any countries for the map.")
 
+mark("Raw data and export")
 # Show raw data
 with st.expander("Show Raw Location Data"):
-    st.dataframe(filtered_data)
-    st.download_button("Export Data as CSV", data=filtered_data.to_csv(index=False), file_name="filtered_data.csv")
\ No newline at end of file
+    raw_data_viewer(filters, key="location_raw")
+    export_button(filters, key="location_export")
\ No newline at end of file
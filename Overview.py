@@ -1,20 +1,20 @@
 import streamlit as st  # type: ignore
-import pandas as pd
 import plotly.express as px  # type: ignore
-from geopy.geocoders import Nominatim  # type: ignore
 import time
 from datetime import datetime
-
-# Load dataset
-@st.cache_data
-def load_data():
-    df = pd.read_csv('ai_solutions_web_sales_logs.csv', parse_dates=['timestamp', 'date_of_sale'], dayfirst=True)
-    return df
-
+from query_backend import get_backend, unique_customers, year_range
+from figures import px_figure
+from data_viewer import raw_data_viewer
+from export import export_button
+from instrumentation import mark
+from geocode import add_latlon
+
+mark("Load data")
 start = time.time()
 # Load data with a spinner
 with st.spinner("Loading data..."):
-    df = load_data()
+    # KPIs and charts are roll-ups from the query backend (see query_backend.py)
+    backend = get_backend()
 end = time.time()
 Loading_time = end - start
 st.success("Data loaded successfully! Loaded Data in: {:.2f} seconds 🥳".format(Loading_time))
@@ -22,6 +22,7 @@ st.success("Data loaded successfully! Loaded Data in: {:.2f} seconds 🥳".forma
 st.markdown("# Overview 🎈")
 st.sidebar.markdown("# Overview 🎈")
 
+mark("Sidebar filters")
 # Sidebar filters with "Select All" functionality
 st.sidebar.header("Filters")
 st.sidebar.write("Select filters to customize the data view. For example, choose a country or salesperson.")
@@ -43,24 +44,24 @@ def multiselect_with_select_all(label, options, default):
         selected = st.sidebar.multiselect(label, options, default=[], key=label)
     return selected
 
+# Filter options are the values in the log, from the query backend
+country_options = list(backend.rollup('customer_country').index)
+salesperson_options = list(backend.rollup('salesperson').index)
 customer_country = st.sidebar.multiselect(
     "Customer Country",
-    options=df['customer_country'].unique(),
-    default=df['customer_country'].unique(),
+    options=country_options,
+    default=country_options,
     help="Select one or more countries to filter the data."
 )
 salesperson = multiselect_with_select_all(
     "Salesperson",
-    options=df['salesperson'].unique(),
-    default=df['salesperson'].unique()
+    options=salesperson_options,
+    default=salesperson_options
 )
 
-# Filter data based on sidebar selections
-filtered_data = df[
-    (df['customer_country'].isin(customer_country)) &
-    (df['salesperson'].isin(salesperson))
-]
+filters = {'customer_country': customer_country, 'salesperson': salesperson}
 
+mark("KPIs")
 # Define target sales (example: 100,000, adjust as needed)
 SALES_TARGET = 1000000000
 
@@ -68,16 +69,15 @@ SALES_TARGET = 1000000000
 current_year = datetime.now().year
 last_year = current_year - 1
 
-# Filter data for current and last year
-filtered_data['year'] = filtered_data['date_of_sale'].dt.year
-current_year_data = filtered_data[filtered_data['year'] == current_year]
-last_year_data = filtered_data[filtered_data['year'] == last_year]
+# Interactions in the current and last year, reading only those years' months
+ytd_interactions = int(backend.date_range(*year_range(current_year), filters)['count'])
+last_ytd_interactions = int(backend.date_range(*year_range(last_year), filters)['count'])
 
 # KPIs
 kpi1, kpi2, kpi3, kpi4, kpi5 = st.columns([2.25,1,1.25,0.9,1.25])
 
 with kpi1:
-    total_sales = filtered_data['cost'].sum()
+    total_sales = backend.total(filters)['cost']
     delta_sales = ((total_sales - SALES_TARGET) / SALES_TARGET) * 100 if SALES_TARGET else 0
     st.metric(
         "Total Revenue",
@@ -86,8 +86,6 @@ with kpi1:
     )
 
 with kpi2:
-    ytd_interactions = current_year_data.shape[0]
-    last_ytd_interactions = last_year_data.shape[0]
     delta_interactions = ytd_interactions - last_ytd_interactions
     delta_pct = (delta_interactions / last_ytd_interactions * 100) if last_ytd_interactions else 0
     st.metric(
@@ -97,8 +95,8 @@ with kpi2:
     )
 
 with kpi3:
-    ytd_customers = current_year_data['ip_address'].nunique()
-    last_ytd_customers = last_year_data['ip_address'].nunique()
+    ytd_customers = unique_customers(filters, current_year)
+    last_ytd_customers = unique_customers(filters, last_year)
     delta_customers = ytd_customers - last_ytd_customers
     delta_customers_pct = (delta_customers / last_ytd_customers * 100) if last_ytd_customers else 0
     st.metric(
@@ -108,15 +106,10 @@ with kpi3:
     )
 
 with kpi4:
-    st.metric("Unique Countries", filtered_data['customer_country'].nunique())
+    st.metric("Unique Countries", len(backend.rollup('customer_country', filters)))
     
 with kpi5:
-    best_product = (
-        filtered_data.groupby('product_sold')['cost']
-        .sum()
-        .sort_values(ascending=False)
-        .reset_index()
-    )
+    best_product = backend.revenue_by('product_sold', filters).reset_index()
     if not best_product.empty:
         best_name = best_product.loc[0, 'product_sold']
         best_sales = best_product.loc[0, 'cost']
@@ -135,64 +128,62 @@ with kpi5:
     else:
         st.metric("Best Performing Product", "N/A", "N/A")
     
+mark("Monthly sales chart")
 # Sales Over Time (Interactive with Plotly)
 
 st.header("Monthly Sales Over Time")
-# Group by year and month for monthly aggregation
-sales_over_time = (
-    filtered_data
-    .set_index('date_of_sale')
-    .resample('M')['cost']
-    .sum()
-    .reset_index()
-)
+# Monthly aggregation
+sales_over_time = backend.monthly_series('cost', filters).rename_axis('date_of_sale').reset_index()
 sales_over_time['month'] = sales_over_time['date_of_sale'].dt.strftime('%Y-%m')
 
-fig3 = px.line(
+fig3 = px_figure(
+    'line',
     sales_over_time,
     x='month',
     y='cost',
     markers=True,
     labels={'month': 'Month', 'cost': 'Total Sales'},
-    hover_data={'month': True, 'cost': ':.2f'}
-)
-fig3.update_traces(hovertemplate='Month: %{x}<br>Total Sales: %{y:.2f}')
-fig3.update_layout(
-    xaxis=dict(
-        tickmode='array',
-        tickvals=sales_over_time['month'][::max(1, len(sales_over_time)//8)],
-        ticktext=sales_over_time['month'][::max(1, len(sales_over_time)//8)],
-        tickangle=45
-    ),
-    margin=dict(l=20, r=20, t=40, b=40)
+    hover_data={'month': True, 'cost': ':.2f'},
+    traces=dict(hovertemplate='Month: %{x}<br>Total Sales: %{y:.2f}'),
+    layout=dict(
+        xaxis=dict(
+            tickmode='array',
+            tickvals=sales_over_time['month'][::max(1, len(sales_over_time)//8)],
+            ticktext=sales_over_time['month'][::max(1, len(sales_over_time)//8)],
+            tickangle=45
+        ),
+        margin=dict(l=20, r=20, t=40, b=40)
+    )
 )
 st.plotly_chart(fig3, use_container_width=True)
 
+mark("Country and interaction charts")
 Sec1, Sec2 = st.columns([1.75, 2.25])
 with Sec1:
     st.header("Customer Country Distribution")
-    country_counts = filtered_data['customer_country'].value_counts().reset_index()
+    country_counts = backend.ranked('customer_country', 'count', filters).reset_index()
     country_counts.columns = ['country', 'count']
-    fig = px.bar(
+    fig = px_figure(
+        'bar',
         country_counts,
         x='country',
         y='count',
         color='count',
         color_continuous_scale='viridis',
         labels={'country': 'Country', 'count': 'Number of Interactions'},
+        layout=dict(xaxis_tickangle=45, margin=dict(l=20, r=20, t=40, b=40))
     )
-    fig.update_layout(xaxis_tickangle=45, margin=dict(l=20, r=20, t=40, b=40))
     st.plotly_chart(fig, use_container_width=True)
 with Sec2:
     st.header("Top 5 Customer Interaction Types")
     interaction_counts = (
-        filtered_data['customer_interaction']
-        .value_counts()
+        backend.ranked('customer_interaction', 'count', filters)
         .head(5)
         .reset_index()
     )
     interaction_counts.columns = ['interaction_type', 'count']
-    fig2 = px.bar(
+    fig2 = px_figure(
+        'bar',
         interaction_counts,
         x='count',
         y='interaction_type',
@@ -200,75 +191,64 @@ with Sec2:
         color='count',
         color_continuous_scale='viridis',
         labels={'interaction_type': 'Interaction Type', 'count': 'Number of Interactions'},
+        layout=dict(margin=dict(l=20, r=20, t=40, b=40))
     )
-    fig2.update_layout(margin=dict(l=20, r=20, t=40, b=40))
     st.plotly_chart(fig2, use_container_width=True)
 
+mark("Product and salesperson charts")
 Sec3, Sec4 = st.columns([1.69, 2.31])
 with Sec3:
     # Product Popularity (Pie Chart)
     st.header("Product Popularity")
-    product_counts = filtered_data['product_sold'].value_counts().reset_index()
+    product_counts = backend.ranked('product_sold', 'count', filters).reset_index()
     product_counts.columns = ['product', 'count']
-    fig4 = px.pie(
+    fig4 = px_figure(
+        'pie',
         product_counts,
         names='product',
         values='count',
         color_discrete_sequence=px.colors.sequential.Viridis,
         hole=0.4,
+        traces=dict(textinfo='percent+label'),
+        layout=dict(margin=dict(l=20, r=20, t=40, b=40))
     )
-    fig4.update_traces(textinfo='percent+label')
-    fig4.update_layout(margin=dict(l=20, r=20, t=40, b=40))
     st.plotly_chart(fig4, use_container_width=True)
 with Sec4:
     # Sales by Salesperson (Bar Graph)
     st.header("Sales by Salesperson")
-    salesperson_sales = (
-        filtered_data.groupby('salesperson')['cost']
-        .sum()
-        .sort_values(ascending=False)
-        .reset_index()
-    )
-    fig5 = px.bar(
+    salesperson_sales = backend.revenue_by('salesperson', filters).reset_index()
+    fig5 = px_figure(
+        'bar',
         salesperson_sales,
         x='salesperson',
         y='cost',
         color='cost',
         color_continuous_scale='viridis',
         labels={'salesperson': 'Salesperson', 'cost': 'Total Sales'},
-    )
-    fig5.update_layout(
-        xaxis_tickangle=45,
-        title='Sales Distribution by Salesperson',
-        margin=dict(l=20, r=20, t=40, b=40)
+        layout=dict(
+            xaxis_tickangle=45,
+            title='Sales Distribution by Salesperson',
+            margin=dict(l=20, r=20, t=40, b=40)
+        )
     )
     st.plotly_chart(fig5, use_container_width=True)
 
+mark("Customer map")
 # Location Insights Map using customer_country
 st.header("Customer Locations Map")
-# Use pycountry and pycountry_convert to get approximate lat/lon for each country
+# Approximate lat/lon for each country from the bundled gazetteer
 
-country_counts = filtered_data['customer_country'].value_counts().reset_index()
+country_counts = backend.ranked('customer_country', 'count', filters).reset_index()
 country_counts.columns = ['country', 'count']
-
-geolocator = Nominatim(user_agent="country_locator")
-def get_country_latlon(country):
-    try:
-        location = geolocator.geocode(country)
-        if location:
-            return pd.Series({'lat': location.latitude, 'lon': location.longitude})
-    except Exception:
-        pass
-    return pd.Series({'lat': None, 'lon': None})
-
-country_counts[['lat', 'lon']] = country_counts['country'].apply(get_country_latlon)
+country_counts = add_latlon(country_counts)
 map_df = country_counts.dropna(subset=['lat', 'lon'])
 if not map_df.empty:
     st.map(map_df[['lat', 'lon', 'count']])
 else:
     st.warning("Could not geocode any countries for the map.")
     
+mark("Raw data and export")
 with st.expander("Show Raw Data"):
-    st.dataframe(filtered_data)
-    
-st.download_button("Export Data as CSV", data=filtered_data.to_csv(index=False), file_name="filtered_data.csv")
+    raw_data_viewer(filters, key="overview_raw")
+
+export_button(filters, key="overview_export")
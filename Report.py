@@ -1,4 +1,7 @@
 import streamlit as st  # type: ignore
+from query_backend import EXACT_UNIQUES
+from instrumentation import SETTINGS, finish_page, start_page
+from warmup import start_warmup, status_indicator
 
 st.set_page_config(
     page_title="Ai-Solutions Product Sales Dashboard",
@@ -7,6 +10,9 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# --- Cache warmup: starts loading shared data on the first run in this process ---
+warmup = start_warmup()
+
 # --- Session state initialization ---
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -37,6 +43,20 @@ if st.sidebar.button("Logout"):
     st.session_state.username = ""
     st.rerun()
 
+st.sidebar.toggle(
+    "Exact unique customers",
+    key=EXACT_UNIQUES,
+    help="Count unique customers exactly instead of estimating them (about 1.6% error). Slower on large logs."
+)
+
+# --- Admin performance tools ---
+if st.session_state.role == "Admin":
+    status_indicator(warmup)
+    with st.sidebar.expander("Performance"):
+        st.checkbox("Show render timings", key=SETTINGS['panel'])
+        st.checkbox("Log timings as JSON", key=SETTINGS['json_log'], help="Appends one line per rerun to profiles/timings.jsonl.")
+        st.checkbox("cProfile each rerun", key=SETTINGS['cprofile'], help="Writes a .prof file per rerun to profiles/.")
+
 # --- Role-based navigation ---
 main_page = st.Page("Overview.py", title="Overview", icon="🎈")
 page_2 = st.Page("JobsNRequests.py", title="Jobs & Requests", icon="❄️")
@@ -56,4 +76,6 @@ else:
     pages = [main_page]
 
 pg = st.navigation(pages)
-pg.run()
\ No newline at end of file
+start_page(pg.title)
+pg.run()
+finish_page()
\ No newline at end of file
@@ -1,22 +1,23 @@
 import streamlit as st  # type: ignore
 import pandas as pd
-import os
-import plotly.express as px  # type: ignore
-import plotly.graph_objects as go # type: ignore
-from sklearn.cluster import KMeans
 import time # type: ignore
-
-# Load dataset
-@st.cache_data
-def load_data():
-    df = pd.read_csv('ai_solutions_web_sales_logs.csv', parse_dates=['timestamp', 'date_of_sale'], dayfirst=True)
-    return df
-
-df = load_data()
+from data_loader import data_version
+from backtest import load_results, results_mtime, series_key
+from clustering import get_region_clusters
+from query_backend import get_backend, latest_rows
+from forecasting import load_monthly, load_weekly
+from figures import monthly_forecast_chart, px_figure, sales_target_bar, weekly_forecast_chart, yearly_sales_comparison
+from export import export_button
+from instrumentation import mark
+
+mark("Load data")
+# KPIs and charts are roll-ups from the query backend (see query_backend.py)
+backend = get_backend()
 
 st.markdown("# Sales Team Performance 🎉")
 st.sidebar.markdown("# Sales Team Performance 🎉")
 
+mark("Sidebar filters")
 # Sidebar filters with "Select All" functionality
 st.sidebar.header("Filters")
 st.sidebar.write("Select filters to customize the data view. For example, choose a country or salesperson.")
@@ -38,46 +39,38 @@ def multiselect_with_select_all(label, options, default):
         selected = st.sidebar.multiselect(label, options, default=[], key=label)
     return selected
 
+# Filter options are the values in the log, from the query backend
+country_options = list(backend.rollup('customer_country').index)
+salesperson_options = list(backend.rollup('salesperson').index)
 customer_country = multiselect_with_select_all(
     "Customer Country",
-    options=df['customer_country'].unique(),
-    default=df['customer_country'].unique()
+    options=country_options,
+    default=country_options
 )
 salesperson = multiselect_with_select_all(
     "Salesperson",
-    options=df['salesperson'].unique(),
-    default=df['salesperson'].unique()
+    options=salesperson_options,
+    default=salesperson_options
 )
-# Filter data based on sidebar selections
-filtered_data = df[
-    (df['customer_country'].isin(customer_country)) &
-    (df['salesperson'].isin(salesperson))
-]
+filters = {'customer_country': customer_country, 'salesperson': salesperson}
+mark("KPIs")
 # KPI Section: Sales Team Performance
 kpi1, kpi2, kpi3, kpi4 = st.columns([2.5,1.5,1,1.25])
 
 # Year to Date KPI: Compare current YTD vs last year's YTD (same date range)
-today = pd.Timestamp.today()
+# Both periods run to the end of the day, so the bounds (and the cached
+# queries keyed on them) only change once a day.
+today = pd.Timestamp.today().normalize()
+end_of_day = pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
 start_of_year = pd.Timestamp(year=today.year, month=1, day=1)
 start_of_last_year = pd.Timestamp(year=today.year - 1, month=1, day=1)
-same_day_last_year = pd.Timestamp(year=today.year - 1, month=today.month, day=today.day)
-
-# Check if filtered_data is empty or missing columns
-if filtered_data.empty or 'date_of_sale' not in filtered_data.columns or 'cost' not in filtered_data.columns:
-    ytd_sales = 0
-    ytd_count = 0
-    last_ytd_sales = 0
-    last_ytd_count = 0
-else:
-    # Current YTD
-    ytd_data = filtered_data[(filtered_data['date_of_sale'] >= start_of_year) & (filtered_data['date_of_sale'] <= today)]
-    ytd_sales = ytd_data['cost'].sum()
-    ytd_count = ytd_data['cost'].count()
+same_day_last_year = pd.Timestamp(year=today.year - 1, month=today.month, day=today.day) + end_of_day
 
-    # Last year's YTD (same period)
-    last_ytd_data = filtered_data[(filtered_data['date_of_sale'] >= start_of_last_year) & (filtered_data['date_of_sale'] <= same_day_last_year)]
-    last_ytd_sales = last_ytd_data['cost'].sum()
-    last_ytd_count = last_ytd_data['cost'].count()
+# Date-range queries only read the months in each period
+ytd_sales, ytd_count = backend.date_range(start_of_year, today + end_of_day, filters)[['cost', 'count']]
+
+# Last year's YTD (same period)
+last_ytd_sales, last_ytd_count = backend.date_range(start_of_last_year, same_day_last_year, filters)[['cost', 'count']]
 
 # Calculate deltas
 sales_delta = ytd_sales - last_ytd_sales
@@ -102,65 +95,76 @@ with kpi2:
     
 
 # Best Performing Salesperson
-best_salesperson = (
-    filtered_data.groupby('salesperson')['cost'].sum().idxmax()
-    if not filtered_data.empty else "N/A"
-)
-best_salesperson_amount = (
-    filtered_data.groupby('salesperson')['cost'].sum().max()
-    if not filtered_data.empty else 0
-)
+salesperson_totals = backend.revenue_by('salesperson', filters)
+best_salesperson = salesperson_totals.index[0] if not salesperson_totals.empty else "N/A"
+best_salesperson_amount = salesperson_totals.iloc[0] if not salesperson_totals.empty else 0
 with kpi3:
     st.metric("Best Salesperson", f"{best_salesperson}")
-# Forecast Model Accuracy KPI
-forecast_accuracy = 89.04  # Replace with dynamic calculation if available
+# Forecast Model Accuracy KPI: rolling-origin backtest of the selected salesperson's
+# forecast (overall forecast unless exactly one salesperson is selected)
+@st.cache_data
+def load_backtests(version, mtime):
+    return load_results(version)
+
+backtests, stale_backtests = load_backtests(data_version(), results_mtime())
+accuracy_salesperson = salesperson[0] if len(salesperson) == 1 else None
+backtest = (backtests or {}).get(series_key(accuracy_salesperson))
 with kpi4:
-    st.metric("Forecast Model Accuracy", f"{forecast_accuracy:.2f}%")
+    if backtest:
+        # Results from before the latest ingest are shown, marked as stale.
+        st.metric(
+            "Forecast Model Accuracy (stale)" if stale_backtests else "Forecast Model Accuracy",
+            f"{backtest['accuracy']:.2f}%",
+            help=f"1 - MAPE of the {accuracy_salesperson or 'overall'} monthly forecast, "
+                 f"{backtest['folds']} rolling origins, {backtest['horizon']} months ahead."
+                 + (" Computed for an earlier version of the data; run `python backtest.py` to update." if stale_backtests else "")
+        )
+    else:
+        st.metric("Forecast Model Accuracy", "N/A", help="Backtests not computed yet for this data. Run `python backtest.py`.")
 
+mark("Salesperson performance")
 # Section 2: Salesperson Performance
-sales_data = df[df['salesperson'] != 'N/A']
-sales_summary = sales_data.groupby('salesperson').agg(
-    total_sales=('cost', 'sum'),
-    number_of_sales=('cost', 'count'),
-    average_sale=('cost', 'mean')
-).reset_index()
+sales_summary = (
+    backend.rollup('salesperson')
+    .drop(index='N/A', errors='ignore')
+    .sort_index()
+    .rename(columns={'cost': 'total_sales', 'count': 'number_of_sales'})
+)
+sales_summary['average_sale'] = sales_summary['total_sales'] / sales_summary['number_of_sales']
+sales_summary = sales_summary.rename_axis('salesperson').reset_index()
+salespeople = sales_summary['salesperson'].tolist()
 
-col1, col2 = st.columns([2.5,1.5])
+# Sections with their own widgets are fragments: changing one of those widgets
+# reruns only that section, not the KPIs and other charts above and below it.
 
-with col1:
+@st.fragment
+def monthly_sales_section(backend, filters):
     st.header("Monthly Sales Over Time")
     # Product filter for this plot
-    product_options = ['All'] + list(filtered_data['product_sold'].unique())
+    product_options = ['All'] + list(backend.rollup('product_sold', filters).index)
     selected_product = st.selectbox(
         "Select Product for Monthly Sales Over Time",
         options=product_options,
         key="monthly_sales_product_filter"
     )
-    if selected_product == 'All':
-        filtered_monthly = filtered_data
-    else:
-        filtered_monthly = filtered_data[filtered_data['product_sold'] == selected_product]
-
-    # Group by year and month for monthly aggregation
-    filtered_monthly['year'] = filtered_monthly['date_of_sale'].dt.year
-    filtered_monthly['month'] = filtered_monthly['date_of_sale'].dt.month
+    monthly_filters = dict(filters)
+    if selected_product != 'All':
+        monthly_filters['product_sold'] = [selected_product]
 
     # Get current and last year
     current_year = pd.Timestamp.today().year
     last_year = current_year - 1
 
     # Aggregate sales by year and month
-    monthly_sales = (
-        filtered_monthly
-        .groupby(['year', 'month'])['cost']
-        .sum()
-        .reset_index()
-    )
+    monthly_totals = backend.rollup('month', monthly_filters)['cost']
+    monthly_sales = pd.DataFrame({
+        'year': monthly_totals.index.year,
+        'month': monthly_totals.index.month,
+        'cost': monthly_totals.to_numpy(),
+    })
 
     # Prepare data for plotting
     months = range(1, 13)
-    df_this_year = pd.DataFrame({'month': months})
-    df_last_year = pd.DataFrame({'month': months})
 
     # For current year, only plot up to May (month 5)
     this_year_sales = monthly_sales[monthly_sales['year'] == current_year][['month', 'cost']].set_index('month').reindex(months, fill_value=0).reset_index()
@@ -172,210 +176,144 @@ with col1:
     sales_target = last_year_sales['cost'].mean()
 
     # Prepare month labels
-    month_labels = pd.date_range('2023-01-01', periods=12, freq='MS').strftime('%b')
-
-    fig_ly = go.Figure()
-
-    # Last year (blue)
-    fig_ly.add_trace(go.Scatter(
-        x=month_labels,
-        y=last_year_sales['cost'],
-        mode='lines+markers',
-        name=f'{last_year} Sales',
-        line=dict(color='royalblue', width=3),
-        marker=dict(color='royalblue')
-    ))
-
-    # This year (green, only up to May)
-    fig_ly.add_trace(go.Scatter(
-        x=month_labels,
-        y=this_year_sales['cost'],
-        mode='lines+markers',
-        name=f'{current_year} Sales',
-        line=dict(color='green', width=3),
-        marker=dict(color='green')
-    ))
-
-    # Sales target (red dashed)
-    fig_ly.add_trace(go.Scatter(
-        x=month_labels,
-        y=[sales_target]*12,
-        mode='lines',
-        name='Sales Target (Last Year Avg)',
-        line=dict(color='red', width=2, dash='dash')
-    ))
-
-    fig_ly.update_layout(
-        title=f'Monthly Sales: {current_year} vs {last_year}',
-        xaxis_title='Month',
-        yaxis_title='Total Sales',
-        legend_title_text='',
-        margin=dict(l=20, r=20, t=40, b=40),
-        xaxis=dict(tickmode='array', tickvals=month_labels, tickangle=45)
+    month_labels = list(pd.date_range('2023-01-01', periods=12, freq='MS').strftime('%b'))
+
+    fig_ly = yearly_sales_comparison(
+        month_labels,
+        last_year_sales['cost'],
+        this_year_sales['cost'],
+        sales_target,
+        current_year,
+        last_year
     )
 
     st.plotly_chart(fig_ly, use_container_width=True)
 
+
+@st.fragment
+def monthly_forecast_section(salespeople):
+    st.header("Monthly Sales Forecast")
+
+    # Use the same salesperson filter as in your data section
+    forecast_salesperson = st.selectbox(
+        "Select Salesperson for Forecast", 
+        ['All'] + salespeople,
+        key="forecast_salesperson"
+    )
+
+    # Typed forecast outputs with datetime months (see forecasting.py)
+    if forecast_salesperson != 'All':
+        outputs = load_monthly(forecast_salesperson)
+        if outputs is None:
+            st.warning("Not enough data for this salesperson's forecast.")
+    else:
+        outputs = load_monthly()
+        if outputs is None:
+            st.warning("Not enough data for overall forecast.")
+
+    if outputs is not None:
+        actuals_df, forecast_df = outputs
+        # Actuals: plot all available, then every forecast month
+        fig = monthly_forecast_chart(actuals_df[['month', 'cost']], forecast_df[['month', 'forecast']])
+        st.plotly_chart(fig, use_container_width=True)
+
+
+@st.fragment
+def clustering_section():
+    Part3, Part4 = st.columns([2, 3])
+    with Part3:
+        # === Sales Clustering by Region Section ===
+        # st.header("Sales Clustering by Region")
+
+        # Countries clustered on revenue, volume, engagement mix and product mix,
+        # computed once per data version (see clustering.py)
+        cluster_data = get_region_clusters()[['customer_country', 'cost', 'Cluster']]
+        sales_col = 'cost'
+        region_col = 'customer_country'
+
+        # Visualize clusters with plotly
+        fig = px_figure(
+            'bar',
+            cluster_data.sort_values('Cluster'),
+            x=region_col,
+            y=sales_col,
+            color='Cluster',
+            color_continuous_scale='viridis',
+            labels={region_col: "Region", sales_col: "Total Sales", "Cluster": "Cluster Group"},
+            title="Sales Clustering by Region",
+            layout=dict(
+                xaxis_tickangle=45,
+                margin=dict(l=20, r=20, t=40, b=40)
+            )
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    with Part4:
+        # Show cluster assignments as a table
+        st.subheader("Region Cluster Assignments")
+        st.dataframe(cluster_data.rename(
+            columns={region_col: "Region", sales_col: "Total Sales", "Cluster": "Cluster Group"}
+        ), hide_index=True)
+
+
+@st.fragment
+def filtered_sales_section(salespeople):
+    st.header("Filter Sales Forecast")
+    selected_salesperson = st.selectbox("Select Salesperson", ['All'] + salespeople)
+    if selected_salesperson != 'All':
+        sales_filters = {'salesperson': [selected_salesperson]}
+    else:
+        sales_filters = {'salesperson': [value for value in salesperson_options if value != 'N/A']}
+    columns = ['timestamp', 'product_sold', 'cost', 'customer_country', 'job_type_requested']
+    st.dataframe(latest_rows(columns, 20, sales_filters))
+
+
+    # Download button for filtered data
+    section1, section2 = st.columns([1, 3])
+    with section1:
+        export_button(sales_filters, file_stem="filtered_sales_data", key="sales_export", label="Download Filtered Data")
+    with section2:
+        st.write("Download the filtered data as CSV, gzip-compressed CSV or Parquet.")
+
+
+mark("Monthly sales chart")
+col1, col2 = st.columns([2.5,1.5])
+
+with col1:
+    monthly_sales_section(backend, filters)
+
 with col2:
     # Calculate a reasonable sales target: e.g., 10% above the average total sales
     avg_total_sales = sales_summary['total_sales'].mean()
     sales_target = avg_total_sales * 1.10  # 10% above average
 
-    fig3 = px.bar(
-        sales_summary,
-        x='salesperson',
-        y='total_sales',
-        color='total_sales',
-        color_continuous_scale='viridis',
-        labels={'total_sales': 'Total Sales Amount', 'salesperson': 'Salesperson'},
-        title='Total Sales by Salesperson'
-    )
-
-    # Add sales target as a red dashed line
-    fig3.add_shape(
-        type="line",
-        x0=-0.5,
-        x1=len(sales_summary['salesperson']) - 0.5,
-        y0=sales_target,
-        y1=sales_target,
-        line=dict(color="red", width=2, dash="dash"),
-        xref="x",
-        yref="y"
-    )
-    fig3.add_annotation(
-        x=len(sales_summary['salesperson']) - 1,
-        y=sales_target,
-        text=f"Sales Target (${sales_target:,.0f})",
-        showarrow=False,
-        yshift=10,
-        font=dict(color="red", size=12),
-        align="right"
-    )
+    fig3 = sales_target_bar(sales_summary, sales_target)
 
     st.plotly_chart(fig3, use_container_width=True)
 
 st.header("Salesperson Performance")
 st.dataframe(sales_summary)
 
+mark("Monthly forecast")
 # === Monthly Sales Forecast Section ===
-st.header("Monthly Sales Forecast")
-
-# Use the same salesperson filter as in your data section
-forecast_salesperson = st.selectbox(
-    "Select Salesperson for Forecast", 
-    ['All'] + sales_summary['salesperson'].tolist(),
-    key="forecast_salesperson"
-)
-
-# Determine which forecast files to load
-if forecast_salesperson != 'All':
-    forecast_file = f'monthly_forecast_{forecast_salesperson}.csv'
-    actuals_file = f'monthly_actuals_{forecast_salesperson}.csv'
-    if os.path.exists(forecast_file) and os.path.exists(actuals_file):
-        forecast_df = pd.read_csv(forecast_file)
-        actuals_df = pd.read_csv(actuals_file)
-    else:
-        st.warning("Not enough data for this salesperson's forecast.")
-        forecast_df = None
-        actuals_df = None
-else:
-    forecast_file = 'monthly_forecast.csv'
-    actuals_file = 'monthly_actuals.csv'
-    if os.path.exists(forecast_file) and os.path.exists(actuals_file):
-        forecast_df = pd.read_csv(forecast_file)
-        actuals_df = pd.read_csv(actuals_file)
-    else:
-        st.warning("Not enough data for overall forecast.")
-        forecast_df = None
-        actuals_df = None
-
-if forecast_df is not None and actuals_df is not None:
-    # Convert 'month' to datetime if needed
-    if not pd.api.types.is_datetime64_any_dtype(actuals_df['month']):
-        actuals_df['month'] = pd.PeriodIndex(actuals_df['month'], freq='M').to_timestamp()
-    if not pd.api.types.is_datetime64_any_dtype(forecast_df['month']):
-        forecast_df['month'] = pd.PeriodIndex(forecast_df['month'], freq='M').to_timestamp()
-
-    # Actuals: plot all available
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=actuals_df['month'],
-        y=actuals_df['cost'],
-        mode='lines+markers',
-        name='Actual Sales',
-        line=dict(color='royalblue', width=3, dash='solid'),
-        marker=dict(color='royalblue')
-    ))
-
-    # Forecasts: only Jan 2025 to May 2025
-    forecast_mask = (forecast_df['month'] >= pd.Timestamp('2025-01-01')) & (forecast_df['month'] <= pd.Timestamp('2025-05-01'))
-    forecast_2025 = forecast_df[forecast_mask]
-    if not forecast_2025.empty:
-        fig.add_trace(go.Scatter(
-            x=forecast_2025['month'],
-            y=forecast_2025['forecast'],
-            mode='lines+markers',
-            name='Forecast (Jan-May 2025)',
-            line=dict(color='orange', width=3, dash='dash'),
-            marker=dict(color='orange')
-        ))
-
-    fig.update_layout(
-        title='Monthly Sales: Actual vs Forecast (Jan-May 2025)',
-        xaxis_title='Month',
-        yaxis_title='Sales',
-        legend_title_text='',
-        xaxis_tickformat='%Y-%m',
-        xaxis_tickangle=45,
-        margin=dict(l=20, r=20, t=40, b=40)
-    )
-    st.plotly_chart(fig, use_container_width=True)
+monthly_forecast_section(salespeople)
     
+mark("Weekly forecast")
 # === Weekly Sales Forecast Section ===
 st.header("Weekly Sales Forecast (Next 4 Weeks)")
 
-# Load weekly actuals and forecast
-weekly_actuals_path = os.path.join("weekly_outputs", "weekly_actuals.csv")
-weekly_forecast_path = os.path.join("weekly_outputs", "weekly_forecast.csv")
-
-if os.path.exists(weekly_actuals_path) and os.path.exists(weekly_forecast_path):
-    weekly_actuals = pd.read_csv(weekly_actuals_path)
-    weekly_forecast = pd.read_csv(weekly_forecast_path)
-
-    # Parse week start dates for plotting
-    def week_start(week_str):
-        return pd.to_datetime(week_str.split('/')[0])
+# Load weekly actuals and forecast, with week start dates for plotting
+weekly_outputs = load_weekly()
 
-    weekly_actuals['week_start'] = weekly_actuals['week'].apply(week_start)
-    weekly_forecast['week_start'] = weekly_forecast['week'].apply(week_start)
+if weekly_outputs is not None:
+    weekly_actuals, weekly_forecast = weekly_outputs
 
     # Show only the last 8 weeks of actuals and next 4 weeks of forecast
     last_actuals = weekly_actuals.sort_values('week_start').tail(8)
     next_forecast = weekly_forecast.sort_values('week_start').head(4)
 
     # Plot
-    fig_weekly = go.Figure()
-    fig_weekly.add_trace(go.Scatter(
-        x=last_actuals['week_start'],
-        y=last_actuals['cost'],
-        mode='lines+markers',
-        name='Actual',
-        line=dict(color='royalblue')
-    ))
-    fig_weekly.add_trace(go.Scatter(
-        x=next_forecast['week_start'],
-        y=next_forecast['forecast'],
-        mode='lines+markers',
-        name='Forecast',
-        line=dict(color='orange', dash='dash')
-    ))
-    fig_weekly.update_layout(
-        xaxis_title="Week",
-        yaxis_title="Sales",
-        xaxis_tickformat='%Y-%m-%d',
-        legend_title_text='',
-        margin=dict(l=20, r=20, t=40, b=40)
-    )
+    fig_weekly = weekly_forecast_chart(last_actuals[['week_start', 'cost']], next_forecast[['week_start', 'forecast']])
     st.plotly_chart(fig_weekly, use_container_width=True)
 
     # Table: Next 4 weeks forecast
@@ -393,65 +331,10 @@ if os.path.exists(weekly_actuals_path) and os.path.exists(weekly_forecast_path):
 else:
     st.info("Weekly forecast data not available.")
 
-Part3, Part4 = st.columns([2, 3])
-with Part3:
-    # === Sales Clustering by Region Section ===
-    # st.header("Sales Clustering by Region")
-
-    # Prepare data for clustering
-    if 'Region' in df.columns and 'Sales' in df.columns:
-        cluster_data = df.groupby('Region')['Sales'].sum().reset_index()
-        sales_col = 'Sales'
-        region_col = 'Region'
-    else:
-        # Fallback to customer_country and cost
-        cluster_data = df.groupby('customer_country')['cost'].sum().reset_index()
-        sales_col = 'cost'
-        region_col = 'customer_country'
-
-    # Perform KMeans clustering
-    kmeans = KMeans(n_clusters=3, n_init=10, random_state=42)
-    cluster_data['Cluster'] = kmeans.fit_predict(cluster_data[[sales_col]])
-
-    # Visualize clusters with plotly
-    fig = px.bar(
-        cluster_data.sort_values('Cluster'),
-        x=region_col,
-        y=sales_col,
-        color='Cluster',
-        color_continuous_scale='viridis',
-        labels={region_col: "Region", sales_col: "Total Sales", "Cluster": "Cluster Group"},
-        title="Sales Clustering by Region"
-    )
-    fig.update_layout(
-        xaxis_tickangle=45,
-        margin=dict(l=20, r=20, t=40, b=40)
-    )
-    st.plotly_chart(fig, use_container_width=True)
-
-with Part4:
-    # Show cluster assignments as a table
-    st.subheader("Region Cluster Assignments")
-    st.dataframe(cluster_data.rename(
-        columns={region_col: "Region", sales_col: "Total Sales", "Cluster": "Cluster Group"}
-    ), hide_index=True)
-
-
-
+mark("Country clustering")
+# === Sales Clustering by Region Section ===
+clustering_section()
 
+mark("Filtered sales and export")
 # Section 4: Filter Sales Data
-st.header("Filter Sales Forecast")
-selected_salesperson = st.selectbox("Select Salesperson", ['All'] + sales_summary['salesperson'].tolist())
-if selected_salesperson != 'All':
-    filtered = sales_data[sales_data['salesperson'] == selected_salesperson]
-else:
-    filtered = sales_data
-st.dataframe(filtered[['timestamp', 'product_sold', 'cost', 'customer_country', 'job_type_requested']].sort_values(by='timestamp', ascending=False).head(20))
-
-
-# Download button for filtered data
-section1, section2 = st.columns([1, 3])
-with section1:
-    st.download_button("Download Filtered Data", filtered.to_csv(index=False).encode('utf-8'), "filtered_sales_data.csv", "text/csv")
-with section2:
-    st.write("Download the filtered data as CSV.")
+filtered_sales_section(salespeople)
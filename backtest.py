@@ -0,0 +1,152 @@
+"""
+Rolling-origin backtests for the Holt-Winters forecasts.
+
+For each series the model is refit at several forecast origins near the end of
+the history, forecasts `horizon` periods ahead and is scored against what
+actually happened. Accuracy is 1 - MAPE, as in Sales_Forecast.ipynb. Results
+are stored in backtest_results.json under the data version they were computed
+for, so the dashboard only ever reads them. Until they are recomputed after the
+log changes, the dashboard shows the previous results marked as stale.
+
+Usage:
+
+    python backtest.py [--folds 3] [--horizon 6] [--workers N]
+"""
+import argparse
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_loader import data_version, read_log
+from forecasting import GROUPINGS, param_vector, build_specs
+
+RESULTS_FILE = 'backtest_results.json'
+
+DEFAULT_FOLDS = 3
+DEFAULT_HORIZON = 6
+
+# Series shown on the Sales Team page.
+BACKTESTED = ('overall', 'weekly', 'salesperson=')
+
+
+def mape(actual, predicted):
+    actual = np.asarray(actual, dtype=np.float64)
+    predicted = np.asarray(predicted, dtype=np.float64)
+    nonzero = actual != 0
+    if not nonzero.any():
+        return None
+    return float(np.mean(np.abs((actual[nonzero] - predicted[nonzero]) / actual[nonzero])))
+
+
+def backtest_series(spec, folds=DEFAULT_FOLDS, horizon=DEFAULT_HORIZON):
+    """
+    Scores one series at `folds` rolling origins. Runs in a worker process.
+
+    The earliest origin is fit cold; each later one warm-starts from the fit
+    at the origin before it, so no fold sees parameters fit on data past its
+    own origin (the production fit in the forecast store has seen it all).
+    Returns:
+        tuple: (series key, result dict or None if the series is too short)
+    """
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing  # type: ignore
+
+    values = spec.series.to_numpy(dtype=np.float64)
+    last_origin = len(values) - horizon
+    origins = [origin for origin in range(last_origin - folds + 1, last_origin + 1) if origin >= 2 * spec.season]
+    scores = []
+    start_params = None
+    for origin in origins:
+        model = ExponentialSmoothing(values[:origin], trend='add', seasonal='add', seasonal_periods=spec.season)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            fit = None
+            if start_params is not None:
+                try:
+                    fit = model.fit(start_params=np.asarray(start_params), use_brute=False)
+                except Exception:
+                    fit = None
+            if fit is None:
+                fit = model.fit()
+        start_params = param_vector(fit)
+        score = mape(values[origin:origin + horizon], fit.forecast(horizon))
+        if score is not None:
+            scores.append(score)
+    if not scores:
+        return spec.key, None
+    mean_mape = float(np.mean(scores))
+    return spec.key, {
+        'mape': mean_mape,
+        'accuracy': (1 - mean_mape) * 100,
+        'folds': len(scores),
+        'horizon': horizon,
+    }
+
+
+def run(folds=DEFAULT_FOLDS, horizon=DEFAULT_HORIZON, workers=None):
+    """
+    Backtests every series on the Sales Team page for the current data
+    version and saves the results.
+    """
+    version = data_version()
+    df = read_log(columns=['date_of_sale', 'cost', *GROUPINGS])
+    specs = [spec for spec in build_specs(df) if spec.key.startswith(BACKTESTED)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = dict(pool.map(backtest_series, specs, [folds] * len(specs), [horizon] * len(specs)))
+    payload = {'data_version': version, 'results': results}
+    tmp_file = RESULTS_FILE + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_file, RESULTS_FILE)
+    return payload
+
+
+def load_results(version):
+    """
+    The most recent backtest results.
+    Returns:
+        tuple: (results dict or None if never computed, True if they were
+        computed for another data version than `version`)
+    """
+    try:
+        with open(RESULTS_FILE) as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None, False
+    return payload['results'], payload.get('data_version') != version
+
+
+def results_mtime():
+    """
+    Modification time of the results file (None if missing), for cache keys.
+    """
+    try:
+        return os.path.getmtime(RESULTS_FILE)
+    except OSError:
+        return None
+
+
+def series_key(salesperson=None):
+    """
+    Backtest key for a salesperson's monthly series, or the overall one.
+    """
+    return f'salesperson={salesperson}' if salesperson else 'overall'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS, help='Rolling origins per series.')
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON, help='Periods forecast at each origin.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per core).')
+    args = parser.parse_args()
+    start = time.time()
+    payload = run(folds=args.folds, horizon=args.horizon, workers=args.workers)
+    for key, result in payload['results'].items():
+        if result is None:
+            print(f"{key}: not enough data")
+        else:
+            print(f"{key}: {result['accuracy']:.2f}% over {result['folds']} folds")
+    print(f"Backtested {len(payload['results'])} series in {time.time() - start:.2f}s")
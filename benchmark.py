@@ -0,0 +1,267 @@
+"""
+Page latency benchmark for the dashboard at several log sizes.
+
+For each size a synthetic log is generated (see generate_logs.py) into its own
+working directory under .bench/, next to links to the app files. Each page
+script is then run headlessly through Streamlit's AppTest in a fresh process,
+so caches start cold, and the benchmark records:
+
+    cold      first run of the page, including loading and indexing the log
+    rerun     a rerun with no input changes (everything served from caches)
+    widgets   one rerun per sidebar filter / selectbox interaction
+    peak_rss  peak resident memory of the process
+
+Results are compared against benchmark_baseline.json when it exists, and any
+timing or memory more than --tolerance times its baseline is reported as a
+regression (exit status 1).
+
+Usage:
+
+    python benchmark.py [--sizes 100000 1000000 10000000] [--pages Overview.py ...]
+                        [--save-baseline] [--tolerance 1.25]
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+from ingest import PARQUET_DIR, read_manifest
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(REPO_DIR, '.bench')
+BASELINE_FILE = 'benchmark_baseline.json'
+
+PAGES = ['Overview.py', 'Sales_Team.py', 'Location.py', 'CustomerEngagement.py', 'JobsNRequests.py']
+DEFAULT_SIZES = [100_000, 1_000_000, 10_000_000]
+DEFAULT_TOLERANCE = 1.25
+SEED = 42
+PAGE_TIMEOUT = 1800
+
+# Repo files linked into the benchmark directories: the code and the inputs
+# the pages only read. Everything the app generates (Parquet store, snapshot,
+# forecasts, backtests, cluster and geocode caches, profiles) is written
+# inside the benchmark directory instead.
+LINKED = ['*.py', 'country_centroids.csv', 'monthly_actuals*.csv', 'monthly_forecast*.csv']
+
+
+def _linked(name):
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in LINKED)
+
+
+def prepare_dataset(rows, bench_dir=BENCH_DIR):
+    """
+    Creates the working directory for one log size: links to the app files
+    plus a generated Parquet dataset. The dataset is reused if it already
+    holds the requested rows.
+    Returns:
+        str: The working directory.
+    """
+    from generate_logs import generate_batches, write_parquet
+
+    workdir = os.path.join(bench_dir, f'rows_{rows}')
+    os.makedirs(workdir, exist_ok=True)
+    for name in os.listdir(workdir):
+        # Links left by older runs that shared generated files with the repo.
+        path = os.path.join(workdir, name)
+        if os.path.islink(path) and not _linked(name):
+            os.remove(path)
+    for name in os.listdir(REPO_DIR):
+        target = os.path.join(workdir, name)
+        if not _linked(name) or os.path.lexists(target):
+            continue
+        os.symlink(os.path.join(REPO_DIR, name), target)
+
+    parquet_dir = os.path.join(workdir, PARQUET_DIR)
+    manifest = read_manifest(parquet_dir)
+    if manifest is None or manifest.get('rows') != rows or manifest.get('seed') != SEED:
+        start = time.time()
+        write_parquet(generate_batches(rows, seed=SEED), parquet_dir, rows, SEED)
+        print(f"Generated {rows:,} rows in {time.time() - start:.2f}s", file=sys.stderr)
+    return workdir
+
+
+def _interactions(at):
+    """
+    One (name, action) pair per widget interaction to time. Widgets are looked
+    up again at call time because every rerun rebuilds the element tree.
+    """
+    for i, widget in enumerate(at.sidebar.multiselect):
+        def narrow(i=i):
+            multiselect = at.sidebar.multiselect[i]
+            multiselect.set_value(list(multiselect.options[:2])).run()
+        yield f'multiselect:{widget.label}', narrow
+    for i, widget in enumerate(at.selectbox):
+        if len(widget.options) < 2:
+            continue
+        def select(i=i):
+            selectbox = at.selectbox[i]
+            selectbox.set_value(selectbox.options[1]).run()
+        yield f'selectbox:{widget.label}', select
+    for i, widget in enumerate(at.sidebar.checkbox):
+        def toggle(i=i):
+            checkbox = at.sidebar.checkbox[i]
+            checkbox.set_value(not checkbox.value).run()
+        yield f'checkbox:{widget.label}', toggle
+
+
+def bench_page(page, workdir):
+    """
+    Times one page in the current process. Called in a fresh subprocess per
+    page so Streamlit's caches and the peak RSS start from zero.
+    Returns:
+        dict: cold, rerun and per-widget timings in seconds, peak_rss_mb and
+        any exceptions the page raised.
+    """
+    from streamlit.testing.v1 import AppTest  # type: ignore
+
+    os.chdir(workdir)
+    sys.path.insert(0, workdir)
+    at = AppTest.from_file(os.path.join(workdir, page), default_timeout=PAGE_TIMEOUT)
+
+    start = time.perf_counter()
+    at.run()
+    result = {'cold': time.perf_counter() - start}
+
+    start = time.perf_counter()
+    at.run()
+    result['rerun'] = time.perf_counter() - start
+
+    result['widgets'] = {}
+    for name, action in list(_interactions(at)):
+        start = time.perf_counter()
+        action()
+        result['widgets'][name] = time.perf_counter() - start
+
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result['exceptions'] = [e.message for e in at.exception]
+    return result
+
+
+def run_page(page, workdir):
+    """
+    Runs bench_page() in a subprocess and returns its result.
+    """
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--page', page, '--workdir', workdir],
+        cwd=REPO_DIR, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        return {'error': completed.stderr.strip().splitlines()[-1:] or ['exit status ' + str(completed.returncode)]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(sizes=DEFAULT_SIZES, pages=PAGES):
+    """
+    Benchmarks every page at every log size.
+    Returns:
+        dict: {'sizes': {rows: {page: result}}, plus machine details}.
+    """
+    results = {}
+    for rows in sizes:
+        workdir = prepare_dataset(rows)
+        results[str(rows)] = {}
+        for page in pages:
+            results[str(rows)][page] = result = run_page(page, workdir)
+            print(f"{rows:>10,} {_summary(page, result)}", file=sys.stderr)
+    return {
+        'sizes': results,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def _summary(page, result):
+    if 'error' in result:
+        return f"{page:<24} failed: {result['error'][0]}"
+    widgets = result['widgets'].values()
+    slowest = max(widgets) if widgets else 0.0
+    return (
+        f"{page:<24} cold {result['cold']:7.2f}s  rerun {result['rerun']:6.2f}s  "
+        f"slowest widget {slowest:6.2f}s  peak RSS {result['peak_rss_mb']:8.1f} MB"
+        + (f"  ({len(result['exceptions'])} exceptions)" if result['exceptions'] else '')
+    )
+
+
+def _metrics(result):
+    yield 'cold', result['cold']
+    yield 'rerun', result['rerun']
+    for name, seconds in result['widgets'].items():
+        yield name, seconds
+    yield 'peak_rss_mb', result['peak_rss_mb']
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Lists metrics that got worse than tolerance x their baseline value.
+    Returns:
+        list[str]: One line per regression.
+    """
+    regressions = []
+    for rows, pages in current['sizes'].items():
+        for page, result in pages.items():
+            previous = baseline['sizes'].get(rows, {}).get(page)
+            if previous is None or 'error' in previous:
+                continue
+            if 'error' in result:
+                regressions.append(f"{int(rows):,} rows {page}: failed ({result['error'][0]})")
+                continue
+            before = dict(_metrics(previous))
+            for name, value in _metrics(result):
+                if name in before and before[name] > 0 and value > tolerance * before[name]:
+                    regressions.append(
+                        f"{int(rows):,} rows {page} {name}: {value:.2f} vs {before[name]:.2f} "
+                        f"({value / before[name]:.2f}x)"
+                    )
+    return regressions
+
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Log sizes in rows.')
+    parser.add_argument('--pages', nargs='+', default=PAGES, help='Page scripts to benchmark.')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Write the results to {BASELINE_FILE}.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Slowdown factor reported as a regression.')
+    parser.add_argument('--output', default=None, help='Also write the results to this JSON file.')
+    parser.add_argument('--page', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.page:
+        # Worker mode: one page, one process, result as JSON on stdout.
+        print(json.dumps(bench_page(args.page, args.workdir)))
+        sys.exit(0)
+
+    os.chdir(REPO_DIR)
+    current = run(args.sizes, args.pages)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    baseline = load_baseline()
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved baseline to {BASELINE_FILE}")
+    elif baseline is None:
+        print(f"No baseline yet: run with --save-baseline to record {BASELINE_FILE}")
+    else:
+        regressions = compare(current, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regressions against the baseline from {baseline.get('recorded_at')}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,147 @@
+"""
+Customer-country clustering for the Sales Team page.
+
+Each country is described by a feature vector built from the aggregate cube:
+its revenue and number of transactions (log-scaled) plus its engagement mix
+(share of each customer_interaction) and product mix (share of revenue per
+product). The standardized vectors are clustered with MiniBatchKMeans, and
+clusters are numbered by ascending average revenue so labels stay stable
+between runs.
+
+The result depends only on the data, so it is computed once per data version
+and stored in region_clusters.json; the page only reads it.
+
+Usage:
+
+    python clustering.py [--clusters 3]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st  # type: ignore
+
+from data_loader import data_version
+
+RESULTS_FILE = 'region_clusters.json'
+DEFAULT_CLUSTERS = 3
+REGION = 'customer_country'
+
+
+def country_features(cube):
+    """
+    Per-country feature matrix from the cube.
+    Returns:
+        tuple: (totals DataFrame with 'cost' and 'count' per country,
+        features DataFrame with one row per country)
+    """
+    totals = cube.rollup(REGION)[['cost', 'count']]
+    engagement = cube.rollup([REGION, 'customer_interaction'])['count'].unstack(fill_value=0)
+    products = cube.rollup([REGION, 'product_sold'])['cost'].unstack(fill_value=0)
+    features = pd.concat([
+        np.log1p(totals).add_prefix('log_'),
+        engagement.div(engagement.sum(axis=1), axis=0).add_prefix('engagement: '),
+        products.div(products.sum(axis=1), axis=0).add_prefix('product: '),
+    ], axis=1).reindex(totals.index).fillna(0.0)
+    return totals, features
+
+
+def cluster_countries(cube, n_clusters=DEFAULT_CLUSTERS, random_state=42):
+    """
+    Clusters countries on their feature vectors.
+    Returns:
+        pd.DataFrame: customer_country, cost, count and Cluster (0 = lowest
+        average revenue), one row per country.
+    """
+    from sklearn.cluster import MiniBatchKMeans  # type: ignore
+    from sklearn.preprocessing import StandardScaler  # type: ignore
+
+    totals, features = country_features(cube)
+    result = totals.rename_axis(REGION).reset_index()
+    if result.empty:
+        result['Cluster'] = pd.Series(dtype='int64')
+        return result
+    n_clusters = min(n_clusters, len(result))
+    scaled = StandardScaler().fit_transform(features.to_numpy(dtype=np.float64))
+    labels = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        n_init=10,
+        batch_size=1024,
+        random_state=random_state
+    ).fit_predict(scaled)
+    # Renumber clusters by ascending mean revenue.
+    order = result.groupby(labels)['cost'].mean().sort_values().index
+    result['Cluster'] = pd.Series(labels).map({label: rank for rank, label in enumerate(order)}).to_numpy()
+    return result
+
+
+def save_results(clusters, version, n_clusters, path=RESULTS_FILE):
+    payload = {
+        'data_version': version,
+        'n_clusters': n_clusters,
+        'clusters': clusters.to_dict(orient='records'),
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2, default=float)
+    os.replace(tmp_path, path)
+
+
+def load_results(version, n_clusters=DEFAULT_CLUSTERS, path=RESULTS_FILE):
+    """
+    Stored clusters for the given data version, or None if they haven't
+    been computed yet.
+    """
+    try:
+        with open(path) as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if payload.get('data_version') != version or payload.get('n_clusters') != n_clusters:
+        return None
+    return pd.DataFrame(payload['clusters'], columns=[REGION, 'cost', 'count', 'Cluster'])
+
+
+def run(cube, version, n_clusters=DEFAULT_CLUSTERS):
+    """
+    Clusters the countries for a data version and stores the result.
+    """
+    clusters = cluster_countries(cube, n_clusters)
+    save_results(clusters, version, n_clusters)
+    return clusters
+
+
+@st.cache_resource(max_entries=1)
+def _clusters_for_version(version, n_clusters):
+    from cube import get_cube
+
+    clusters = load_results(version, n_clusters)
+    if clusters is None:
+        clusters = run(get_cube(), version, n_clusters)
+    return clusters
+
+
+def get_region_clusters(n_clusters=DEFAULT_CLUSTERS):
+    """
+    Country clusters for the current data version, read from
+    region_clusters.json or computed and stored on first use.
+    """
+    return _clusters_for_version(data_version(), n_clusters)
+
+
+if __name__ == '__main__':
+    from cube import build_cube
+    from data_loader import read_log
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clusters', type=int, default=DEFAULT_CLUSTERS, help='Number of clusters.')
+    args = parser.parse_args()
+    start = time.time()
+    version = data_version()
+    clusters = run(build_cube(read_log(), version), version, args.clusters)
+    for _, row in clusters.sort_values(['Cluster', REGION]).iterrows():
+        print(f"{row[REGION]}: cluster {row['Cluster']} (${row['cost']:,.2f}, {row['count']:,} sales)")
+    print(f"Clustered {len(clusters)} countries in {time.time() - start:.2f}s")
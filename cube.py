@@ -0,0 +1,205 @@
+"""
+Pre-aggregated views of the log for the dashboard KPIs and charts.
+
+Every page filters on customer_country and salesperson, so the cube keeps a
+few small cuboids (group-by tables) that start with those two dimensions plus
+one or two analysis dimensions. A KPI or chart is then a roll-up over a few
+thousand cells instead of a scan of the raw log. Distinct customers are kept
+as HyperLogLog sketches of ip_address per (country, salesperson, month), so
+unique-customer KPIs merge a few sketches whatever the size of the log. Rows
+without an address aren't customers and stay out of the sketches.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st  # type: ignore
+
+import hll
+from data_loader import appended_since, data_version, load_data
+from ip_index import valid_ips
+from query_backend import QueryBackend
+
+FILTER_DIMENSIONS = ('customer_country', 'salesperson')
+
+CUBOIDS = [
+    FILTER_DIMENSIONS + ('product_sold', 'month'),
+    FILTER_DIMENSIONS + ('job_type_requested',),
+    FILTER_DIMENSIONS + ('customer_interaction',),
+    FILTER_DIMENSIONS + ('month',),
+]
+
+SKETCH_DIMENSIONS = FILTER_DIMENSIONS + ('month',)
+
+METRICS = ['cost', 'count']
+
+
+def sale_month(df):
+    """
+    First day of the month of each sale, as datetime64[ns].
+    """
+    return pd.Series(
+        df['date_of_sale'].to_numpy().astype('datetime64[M]').astype('datetime64[ns]'),
+        index=df.index,
+        name='month'
+    )
+
+
+def _aggregate(df, dims):
+    return (
+        df.groupby(list(dims), observed=True)['cost']
+        .agg(cost='sum', count='size')
+        .reset_index()
+    )
+
+
+class AggregateCube(QueryBackend):
+    def __init__(self, cuboids, sketch_keys, sketches, version=None):
+        self.cuboids = cuboids
+        self.sketch_keys = sketch_keys
+        self.sketches = sketches
+        self.version = version
+
+    def _cuboid_for(self, dims):
+        candidates = [c for c in self.cuboids if set(dims) <= set(c)]
+        if not candidates:
+            raise ValueError(f"No cuboid covers dimensions {sorted(dims)}")
+        return self.cuboids[min(candidates, key=lambda c: len(self.cuboids[c]))]
+
+    @staticmethod
+    def _mask(table, filters):
+        mask = np.ones(len(table), dtype=bool)
+        for column, values in (filters or {}).items():
+            if values is not None:
+                mask &= table[column].isin(values).to_numpy()
+        return mask
+
+    def rollup(self, by, filters=None):
+        """
+        Rolls the cube up to the given dimensions.
+        Args:
+            by (str | list): Dimension(s) to group by.
+            filters (dict): Column -> allowed values. Missing or None means all.
+        Returns:
+            pd.DataFrame: 'cost' (sum) and 'count' per observed group, indexed by `by`.
+        """
+        by_list = [by] if isinstance(by, str) else list(by)
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        table = self._cuboid_for(set(by_list) | set(filters))
+        cells = table[self._mask(table, filters)]
+        result = cells.groupby(by_list if len(by_list) > 1 else by_list[0], observed=True)[METRICS].sum()
+        if isinstance(result.index, pd.CategoricalIndex):
+            result.index = result.index.astype(object)
+        return result
+
+    def total(self, filters=None):
+        """
+        Sum of cost and number of rows matching the filters.
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        table = self._cuboid_for(set(filters))
+        return table.loc[self._mask(table, filters), METRICS].sum()
+
+    def date_range(self, first, last, filters=None):
+        """
+        Sum of cost and number of rows matching the filters sold between two
+        timestamps, inclusive. Whole months in the range come from the month
+        cuboid; only the rows of the partial months at either end are read,
+        through the date-range index (see date_index.py).
+        """
+        from date_index import range_total
+        first, last = pd.Timestamp(first), pd.Timestamp(last)
+        if first > last:
+            return pd.Series({'cost': 0.0, 'count': 0})
+        one = pd.Timedelta(1, 'ns')
+        # [full_first, full_stop) is the run of whole months inside the range.
+        full_first = first.to_period('M').to_timestamp()
+        if full_first < first:
+            full_first += pd.offsets.MonthBegin()
+        full_stop = (last + one).to_period('M').to_timestamp()
+        if full_first >= full_stop:
+            return range_total(first, last, filters)
+        months = self.rollup('month', filters)
+        months = months[(months.index >= full_first) & (months.index < full_stop)]
+        total = months[METRICS].sum()
+        if first < full_first:
+            total += range_total(first, full_first - one, filters)
+        if full_stop <= last:
+            total += range_total(full_stop, last, filters)
+        return total
+
+    def distinct_ips(self, filters=None, months=None):
+        """
+        Approximate number of distinct ip_address values.
+        Args:
+            filters (dict): Filters on customer_country and/or salesperson.
+            months (tuple): Optional (first, last) month start timestamps, inclusive.
+        """
+        mask = self._mask(self.sketch_keys, filters)
+        if months is not None:
+            month = self.sketch_keys['month']
+            mask &= ((month >= months[0]) & (month <= months[1])).to_numpy()
+        return hll.estimate(hll.merge(self.sketches[mask]))
+
+    def merge(self, other, version=None):
+        """
+        Combines this cube with one built from other rows of the log: cuboid
+        cells are summed and sketches of the same cell are unioned.
+        """
+        cuboids = {
+            dims: (
+                pd.concat([table, other.cuboids[dims]], ignore_index=True)
+                .groupby(list(dims), observed=True)[METRICS].sum()
+                .reset_index()
+            )
+            for dims, table in self.cuboids.items()
+        }
+        keys = pd.concat([self.sketch_keys, other.sketch_keys], ignore_index=True)
+        groups = keys.groupby(list(SKETCH_DIMENSIONS), observed=True, sort=False)
+        sketch_keys = groups.size().reset_index()[list(SKETCH_DIMENSIONS)]
+        sketches = np.zeros((len(sketch_keys), self.sketches.shape[1]), dtype=self.sketches.dtype)
+        np.maximum.at(sketches, groups.ngroup().to_numpy(), np.concatenate([self.sketches, other.sketches]))
+        return AggregateCube(cuboids, sketch_keys, sketches, version)
+
+
+def build_cube(df, version=None, precision=hll.DEFAULT_PRECISION):
+    """
+    Builds the cuboids and ip_address sketches from the log.
+    """
+    df = df.assign(month=sale_month(df))
+    cuboids = {dims: _aggregate(df, dims) for dims in CUBOIDS}
+
+    groups = df.groupby(list(SKETCH_DIMENSIONS), observed=True)
+    sketch_keys = groups.size().reset_index()[list(SKETCH_DIMENSIONS)]
+    ips = df['ip_address'].to_numpy()
+    valid = valid_ips(ips)
+    sketches = hll.build_registers(
+        hll.hash_values(ips[valid]),
+        groups.ngroup().to_numpy()[valid],
+        len(sketch_keys),
+        p=precision
+    )
+    return AggregateCube(cuboids, sketch_keys, sketches, version)
+
+
+# The last cube built, kept so a version that only appended rows to the log
+# can be built by aggregating just those rows and merging.
+_built = {}
+
+
+@st.cache_resource(max_entries=1)
+def _cube_for_version(version):
+    df = load_data()
+    previous = _built.get('cube')
+    start = appended_since(version, previous.version) if previous is not None else None
+    if start is not None:
+        cube = previous.merge(build_cube(df.iloc[start:], version), version)
+    else:
+        cube = build_cube(df, version)
+    _built['cube'] = cube
+    return cube
+
+
+def get_cube():
+    """
+    The cube for the current data version, built once and shared by all pages.
+    """
+    return _cube_for_version(data_version())
@@ -0,0 +1,96 @@
+import streamlit as st  # type: ignore
+import pandas as pd
+import pyarrow as pa  # type: ignore
+from ingest import LOG_SCHEMA, ensure_parquet, manifest_segments, read_manifest, read_segments, read_table
+from table_store import snapshot_frame, snapshot_table
+
+# Low-cardinality string columns are dictionary-encoded in the Parquet store
+# and arrive as categoricals, so each value is held once and rows only carry a
+# small integer code.
+STRING_DTYPES = {pa.string(): pd.StringDtype()}
+
+# Columns of the log frame, for code that doesn't need the frame itself.
+LOG_COLUMNS = LOG_SCHEMA.names
+
+
+def arrow_to_frame(table):
+    return table.to_pandas(types_mapper=STRING_DTYPES.get)
+
+
+def read_log(columns=None, filter=None):
+    """
+    Reads the web/sales log through the Parquet store, converting the CSV first
+    if it is new or has changed.
+    Args:
+        columns (list): Columns to read, all log columns by default.
+        filter (pyarrow.compute.Expression): Optional row filter.
+    Returns:
+        pd.DataFrame: The typed, categorical-encoded log.
+    """
+    ensure_parquet()
+    return arrow_to_frame(read_table(columns=columns, filter=filter))
+
+
+def data_version():
+    """
+    Identifies the current contents of the log. It changes whenever ingest
+    rebuilds the Parquet store, so caches derived from the log key on it.
+    """
+    ensure_parquet()
+    return read_manifest()['sha256']
+
+
+def _segment_ids(manifest):
+    return [segment.get('sha256', segment['id']) for segment in manifest.get('segments', [])]
+
+
+# The last loaded snapshot and the segments it was read from. When ingest has
+# only appended segments since, the next snapshot is built from it plus just
+# those segments.
+_loaded = {}
+
+
+# Load dataset once per data version and share the same frame with every page.
+# The frame sits on a memory-mapped snapshot (see table_store.py) shared by all
+# server processes on the host, so it is read-only; ip_address is a packed
+# uint32 (see ip_index.py).
+@st.cache_resource(max_entries=1)
+def _load_version(version):
+    manifest = read_manifest() or {}
+    # Snapshot exactly the segments of this manifest, under its own version:
+    # an append may have committed since `version` was read.
+    version = manifest.get('sha256', version)
+    segments = _segment_ids(manifest)
+    previous = _loaded.get('state')
+    if (
+        previous is not None
+        and len(segments) > len(previous['segments'])
+        and segments[:len(previous['segments'])] == previous['segments']
+    ):
+        new_segments = [segment['id'] for segment in manifest['segments'][len(previous['segments']):]]
+        table = snapshot_table(version, lambda: [previous['table'], read_segments(new_segments)])
+        parent = (previous['version'], previous['table'].num_rows)
+    else:
+        table = snapshot_table(version, lambda: [read_table(segments=manifest_segments(manifest))])
+        parent = None
+    _loaded['state'] = {'version': version, 'segments': segments, 'table': table, 'parent': parent}
+    return snapshot_frame(table)
+
+
+def load_data():
+    return _load_version(data_version())
+
+
+def appended_since(version, previous_version):
+    """
+    If the frame for `version` was built by appending rows to the frame for
+    `previous_version`, returns the position of the first appended row, so
+    structures derived from the log can be extended instead of rebuilt.
+    Returns:
+        int | None
+    """
+    state = _loaded.get('state')
+    if state is None or state['version'] != version or state['parent'] is None:
+        return None
+    parent_version, parent_rows = state['parent']
+    return parent_rows if parent_version == previous_version else None
@@ -0,0 +1,149 @@
+"""
+Paginated viewer for the raw log rows behind a page.
+
+Search and sort run on the server over the filtered row positions, and only
+the rows of the visible page are taken from the shared frame and sent to the
+browser, so the payload stays the same size however many rows match. With the
+DuckDB backend the search, sort and page are one query on the Parquet store.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa  # type: ignore
+import streamlit as st  # type: ignore
+
+from data_loader import data_version, load_data
+from filter_index import filter_signature, get_filter_index
+from ingest import LOG_SCHEMA
+from ip_index import IP_COLUMN, format_ips, unpack_ips
+from query_backend import get_backend, in_memory
+
+PAGE_SIZES = [25, 50, 100, 250]
+NO_SORT = '(none)'
+
+
+def _is_text(series):
+    return series.dtype.name in ('category', 'string', 'object') or series.name == IP_COLUMN
+
+
+def search_positions(df, positions, column, text):
+    """
+    Positions whose value in `column` contains `text`, case-insensitively.
+    Categorical columns are matched on their categories, not row by row, and
+    packed addresses on their dotted form.
+    """
+    values = df[column]
+    if values.dtype.name == 'category':
+        matching = np.flatnonzero(values.cat.categories.str.contains(text, case=False, regex=False))
+        mask = np.isin(values.cat.codes.to_numpy()[positions], matching)
+    elif values.dtype == np.uint32:
+        unique, inverse = np.unique(values.to_numpy()[positions], return_inverse=True)
+        dotted = pd.Series(unpack_ips(unique))
+        mask = dotted.str.contains(text, case=False, regex=False, na=False).to_numpy()[inverse]
+    else:
+        mask = values.take(positions).str.contains(text, case=False, regex=False, na=False).to_numpy()
+    return positions[mask]
+
+
+def sort_positions(df, positions, column, ascending=True):
+    """
+    Positions reordered by the values of `column` (stable, so ties keep log order).
+    """
+    values = df[column]
+    if values.dtype.name == 'category':
+        # Codes follow the order values were first seen; sort by label instead.
+        rank = np.empty(len(values.cat.categories), dtype=np.int64)
+        rank[np.argsort(values.cat.categories.to_numpy(dtype=str))] = np.arange(len(rank))
+        keys = rank[values.cat.codes.to_numpy()[positions]]
+        order = np.argsort(keys if ascending else -keys, kind='stable')
+    else:
+        order = (
+            values.take(positions)
+            .reset_index(drop=True)
+            .sort_values(ascending=ascending, kind='stable')
+            .index.to_numpy()
+        )
+    return positions[order]
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _view_positions(version, signature, search_column, search, sort_column, ascending):
+    df = load_data()
+    rows = get_filter_index().rows(dict(signature))
+    positions = np.arange(len(df)) if rows is None else rows
+    if search:
+        positions = search_positions(df, positions, search_column, search)
+    if sort_column != NO_SORT:
+        positions = sort_positions(df, positions, sort_column, ascending)
+    return positions
+
+
+def raw_data_viewer(filters, key, df=None):
+    """
+    Renders a searchable, sortable, paginated table of the rows matching
+    the sidebar filters.
+    Args:
+        filters (dict): The page's sidebar filters.
+        key (str): Prefix for the viewer's widget keys, unique per page.
+        df (pd.DataFrame): The shared log frame, load_data() by default.
+            Not used with the DuckDB backend.
+    """
+    frame = in_memory()
+    if frame:
+        df = load_data() if df is None else df
+        columns = list(df.columns)
+        searchable = [column for column in columns if _is_text(df[column])]
+    else:
+        columns = LOG_SCHEMA.names
+        searchable = [
+            field.name for field in LOG_SCHEMA
+            if pa.types.is_dictionary(field.type) or pa.types.is_string(field.type) or field.name == IP_COLUMN
+        ]
+
+    search_col, in_col, sort_col, order_col = st.columns([2, 1.5, 1.5, 1])
+    with search_col:
+        search = st.text_input("Search", key=f"{key}_search", placeholder="Contains...").strip()
+    with in_col:
+        search_column = st.selectbox("In column", searchable, key=f"{key}_search_column")
+    with sort_col:
+        sort_column = st.selectbox("Sort by", [NO_SORT] + columns, key=f"{key}_sort")
+    with order_col:
+        ascending = st.radio("Order", ["Asc", "Desc"], key=f"{key}_order", horizontal=True) == "Asc"
+
+    positions = None
+    if not frame:
+        backend = get_backend()
+        search_arg = (search_column, search) if search else None
+        sort_arg = None if sort_column == NO_SORT else (sort_column, ascending)
+        total = backend.row_count(filters, search_arg)
+    elif search or sort_column != NO_SORT:
+        positions = _view_positions(
+            data_version(), filter_signature(filters), search_column, search, sort_column, ascending
+        )
+        total = len(positions)
+    else:
+        # Log order: no need to materialise the positions at all.
+        index = get_filter_index()
+        positions = index.rows(filters)
+        total = index.n_rows if positions is None else len(positions)
+
+    size_col, page_col, info_col = st.columns([1, 1, 3])
+    with size_col:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    pages = max(1, math.ceil(total / page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    with page_col:
+        page = st.number_input("Page", min_value=1, max_value=pages, step=1, key=page_key)
+    start = (page - 1) * page_size
+    stop = min(start + page_size, total)
+    with info_col:
+        st.caption(f"Rows {start + 1 if total else 0:,}–{stop:,} of {total:,} (page {page} of {pages:,})")
+
+    if not frame:
+        st.dataframe(backend.rows(filters, search_arg, sort_arg, start, stop - start), use_container_width=True)
+        return
+    page_rows = np.arange(start, stop) if positions is None else positions[start:stop]
+    st.dataframe(format_ips(df.take(page_rows)), use_container_width=True)
@@ -0,0 +1,80 @@
+"""
+Date-range index over the date_of_sale of the log.
+
+The in-memory counterpart of the year/month partitions of the Parquet store
+(see ingest.py): row positions are kept sorted by date_of_sale, so every month
+and every date range is one contiguous slice found with two binary searches.
+Year-to-date and same-period-last-year KPIs then cost the rows in the range
+instead of a mask over the whole history; sidebar filters are applied to just
+those rows by testing their bits in the filter index's bitmap.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st  # type: ignore
+
+from data_loader import data_version, load_data
+from filter_index import get_filter_index
+
+
+class DateRangeIndex:
+    """
+    Row positions of the log sorted by date_of_sale.
+    """
+    def __init__(self, dates):
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.order = np.argsort(dates, kind='stable')
+        self.sorted_dates = dates[self.order]
+        self.n_rows = len(dates)
+
+    def rows(self, first, last, bitmap=None):
+        """
+        Positions of the rows sold between two timestamps, inclusive, in
+        date order.
+        Args:
+            first, last (pd.Timestamp): Bounds on date_of_sale.
+            bitmap (np.ndarray): Optional packed row bitmap from
+                FilterIndex.bitmap(); only rows set in it are returned.
+        """
+        start = np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(first), 'ns'), side='left')
+        stop = np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(last), 'ns'), side='right')
+        positions = self.order[start:stop]
+        if bitmap is not None:
+            positions = positions[get_filter_index().contains(bitmap, positions)]
+        return positions
+
+
+@st.cache_resource(max_entries=1)
+def _date_index_for_version(version):
+    return DateRangeIndex(load_data()['date_of_sale'].to_numpy())
+
+
+def get_date_index():
+    """
+    The date-range index for the current data version, shared by all pages.
+    """
+    return _date_index_for_version(data_version())
+
+
+def range_rows(first, last, filters=None):
+    """
+    Positions of the rows matching the filters sold between two timestamps,
+    inclusive.
+    Args:
+        first, last (pd.Timestamp): Bounds on date_of_sale.
+        filters (dict): Column -> selected values. Missing or None means all.
+    Returns:
+        np.ndarray
+    """
+    return get_date_index().rows(first, last, get_filter_index().bitmap(filters))
+
+
+def range_total(first, last, filters=None):
+    """
+    Sum of cost and number of rows matching the filters sold between two
+    timestamps, inclusive.
+    Returns:
+        pd.Series: 'cost' and 'count'.
+    """
+    rows = range_rows(first, last, filters)
+    cost = load_data()['cost'].to_numpy()[rows]
+    return pd.Series({'cost': float(cost.sum()), 'count': len(rows)})
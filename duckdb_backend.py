@@ -0,0 +1,318 @@
+"""
+DuckDB implementation of the query API (see query_backend.py).
+
+Queries run in an embedded DuckDB over the Parquet store written by ingest.py,
+so filters and group-bys are pushed down to a columnar scan of the files and
+only the aggregated rows come back to pandas. DuckDB streams the scan and
+spills to disk when it needs to, which keeps the dashboard usable on logs
+larger than memory. Results are cached per data version and query.
+"""
+import duckdb  # type: ignore
+import pandas as pd
+import streamlit as st  # type: ignore
+
+from data_loader import data_version
+from ingest import DATASET_SCHEMA, LOG_SCHEMA, PARQUET_DIR, manifest_segments, read_manifest, segment_files
+from ip_index import IP_COLUMN
+from query_backend import QueryBackend
+
+MONTH = 'month'
+DIMENSION_SQL = {name: f'"{name}"' for name in LOG_SCHEMA.names}
+DIMENSION_SQL[MONTH] = "date_trunc('month', date_of_sale)"
+
+# Packed ip_address as dotted text, NULL where the address is missing.
+IP_TEXT_SQL = (
+    "CASE WHEN ip_address IS NULL THEN NULL ELSE concat_ws('.', ip_address >> 24, "
+    "(ip_address >> 16) & 255, (ip_address >> 8) & 255, ip_address & 255) END"
+)
+# Raw rows as the viewer and exports show them.
+ROW_SQL = ', '.join(
+    f'{IP_TEXT_SQL if name == IP_COLUMN else DIMENSION_SQL[name]} AS "{name}"' for name in LOG_SCHEMA.names
+)
+
+# Export file extension -> COPY options.
+COPY_OPTIONS = {
+    'csv': 'FORMAT csv, HEADER',
+    'csv.gz': 'FORMAT csv, HEADER, COMPRESSION gzip',
+    'parquet': 'FORMAT parquet',
+}
+
+
+def _dimension(name):
+    try:
+        return DIMENSION_SQL[name]
+    except KeyError:
+        raise ValueError(f"Unknown dimension {name!r}") from None
+
+
+def partition_clause(first, last):
+    """
+    SQL condition and parameters on the year/month partition columns, true
+    for the partitions that can hold sales between two timestamps. DuckDB
+    checks it against each file's path and skips the others unread.
+    """
+    first, last = pd.Timestamp(first), pd.Timestamp(last)
+    return (
+        "(year > ? OR (year = ? AND month >= ?)) AND (year < ? OR (year = ? AND month <= ?))",
+        [first.year, first.year, first.month, last.year, last.year, last.month]
+    )
+
+
+def where_clause(filters=None, months=None, dates=None, search=None):
+    """
+    SQL WHERE clause and parameters for a filters dict.
+    Args:
+        filters (dict): Column -> allowed values. Missing or None means all.
+        months (tuple): Optional (first, last) month start timestamps, inclusive.
+        dates (tuple): Optional (first, last) bounds on date_of_sale, inclusive.
+        search (tuple): Optional (column, text): the column's text contains
+            the text, case-insensitively. Addresses are matched dotted.
+    Returns:
+        tuple: (str, list)
+    """
+    clauses = []
+    params = []
+    for column, values in (filters or {}).items():
+        if values is None:
+            continue
+        values = [str(value) for value in values]
+        if not values:
+            clauses.append('FALSE')
+            continue
+        clauses.append(f"list_contains(?::VARCHAR[], {_dimension(column)}::VARCHAR)")
+        params.append(values)
+    for bounds, column in ((months, DIMENSION_SQL[MONTH]), (dates, 'date_of_sale')):
+        if bounds is None:
+            continue
+        clause, partition_params = partition_clause(*bounds)
+        clauses.extend([clause, f"{column} BETWEEN ? AND ?"])
+        # Python datetimes stop at microseconds; log timestamps are whole seconds.
+        params.extend(partition_params + [pd.Timestamp(bound).floor('us').to_pydatetime() for bound in bounds])
+    if search is not None:
+        column, text = search
+        column_text = IP_TEXT_SQL if column == IP_COLUMN else f"{_dimension(column)}::VARCHAR"
+        clauses.append(f"contains(lower({column_text}), lower(?))")
+        params.append(text)
+    return ('WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+class DuckDBBackend(QueryBackend):
+    """
+    Query backend over one version of the Parquet store.
+    """
+    def __init__(self, version=None, parquet_dir=PARQUET_DIR):
+        self.version = version
+        self.connection = duckdb.connect()
+        # Only the segments the manifest has committed, see segment_files().
+        files = segment_files(manifest_segments(read_manifest(parquet_dir)), parquet_dir)
+        if files:
+            # ingest keeps the partition values out of the files, so year and
+            # month come from the paths and filters on them prune whole files.
+            # Views can't take parameters.
+            paths = ', '.join("'" + path.replace("'", "''") + "'" for path in files)
+            self.connection.execute(
+                f"CREATE VIEW log AS SELECT * FROM read_parquet([{paths}], hive_partitioning = true, "
+                f"hive_types = {{'year': SMALLINT, 'month': TINYINT}})"
+            )
+        else:
+            # Registered tables are only visible to this connection, not to
+            # the cursors queries run on, so copy the empty table in.
+            self.connection.register('empty_log', DATASET_SCHEMA.empty_table())
+            self.connection.execute("CREATE TABLE log AS SELECT * FROM empty_log")
+            self.connection.unregister('empty_log')
+
+    def query(self, sql, params=()):
+        """
+        Runs a query against the `log` view and returns the result as a frame.
+        """
+        return _cached_query(self, self.version, sql, tuple(params))
+
+    def rollup(self, by, filters=None):
+        by_list = [by] if isinstance(by, str) else list(by)
+        where, params = where_clause(filters)
+        dims = ', '.join(f'{_dimension(name)} AS "{name}"' for name in by_list)
+        result = self.query(
+            f"SELECT {dims}, SUM(cost) AS cost, COUNT(*) AS count FROM log {where} "
+            f"GROUP BY ALL ORDER BY ALL",
+            params
+        )
+        if MONTH in result.columns:
+            result[MONTH] = result[MONTH].astype('datetime64[ns]')
+        return result.set_index(by_list if len(by_list) > 1 else by_list[0])
+
+    def total(self, filters=None):
+        where, params = where_clause(filters)
+        result = self.query(f"SELECT COALESCE(SUM(cost), 0) AS cost, COUNT(*) AS count FROM log {where}", params)
+        return result.iloc[0]
+
+    def date_range(self, first, last, filters=None):
+        where, params = where_clause(filters, dates=(first, last))
+        result = self.query(f"SELECT COALESCE(SUM(cost), 0) AS cost, COUNT(*) AS count FROM log {where}", params)
+        return result.iloc[0]
+
+    def latest(self, columns, n, filters=None):
+        """
+        The n rows with the latest timestamps among those matching the
+        filters, latest first.
+        """
+        where, params = where_clause(filters)
+        select = ', '.join(f'{_dimension(name)} AS "{name}"' for name in columns)
+        return self.query(f"SELECT {select} FROM log {where} ORDER BY timestamp DESC LIMIT {int(n)}", params)
+
+    def rows(self, filters=None, search=None, sort=None, offset=0, limit=None):
+        """
+        Raw rows matching the filters, with ip_address as dotted text.
+        Args:
+            search (tuple): Optional (column, text), see where_clause().
+            sort (tuple): Optional (column, ascending). Ties are in timestamp
+                order; unsorted rows are in store order.
+            offset, limit (int): The slice of the matching rows to return.
+        Returns:
+            pd.DataFrame: The log columns.
+        """
+        where, params = where_clause(filters, search=search)
+        order = ''
+        if sort is not None:
+            column, ascending = sort
+            order = f"ORDER BY {_dimension(column)} {'ASC' if ascending else 'DESC'}, timestamp"
+        limit = '' if limit is None else f"LIMIT {int(limit)}"
+        return self.query(f"SELECT {ROW_SQL} FROM log {where} {order} {limit} OFFSET {int(offset)}", params)
+
+    def row_count(self, filters=None, search=None):
+        """
+        Number of rows matching the filters and search, see rows().
+        """
+        where, params = where_clause(filters, search=search)
+        return int(self.query(f"SELECT COUNT(*) AS count FROM log {where}", params)['count'].iloc[0])
+
+    def copy_to(self, path, extension, filters=None):
+        """
+        Writes the rows matching the filters to a file with DuckDB's COPY,
+        which streams them from the Parquet store.
+        Args:
+            path (str): Output file.
+            extension (str): A COPY_OPTIONS key, the export format.
+        """
+        where, params = where_clause(filters)
+        target = path.replace("'", "''")
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"COPY (SELECT {ROW_SQL} FROM log {where}) TO '{target}' ({COPY_OPTIONS[extension]})", params
+            )
+
+    def funnel(self, stages, filters=None, gap=None):
+        """
+        Sessions reaching each stage of a funnel, by the month they entered
+        it; see funnels.py for sessions and stages. Sessions are cut from all
+        of a customer's requests, the filters select the stage requests.
+        Args:
+            stages (list): Stage urls in order.
+            gap (pd.Timedelta): Largest gap within a session, None for no limit.
+        Returns:
+            pd.DataFrame: month, then stage0 .. stageN with the number of
+            that month's entries reaching each stage.
+        """
+        where, params = where_clause(filters)
+        # Peers in timestamp order share the running sum, so requests made
+        # at the same second never start separate sessions.
+        ctes = [
+            "starts AS (SELECT *, COALESCE(epoch(timestamp) - epoch(LAG(timestamp) OVER customer) > ?, FALSE)::INTEGER "
+            "AS start FROM log WHERE ip_address IS NOT NULL WINDOW customer AS (PARTITION BY ip_address ORDER BY timestamp))",
+            "sessions AS (SELECT *, SUM(start) OVER (PARTITION BY ip_address ORDER BY timestamp) AS session FROM starts)",
+            f"staged AS (SELECT * FROM (SELECT ip_address, session, timestamp, "
+            f"list_position(?::VARCHAR[], url::VARCHAR) - 1 AS stage FROM sessions {where}) WHERE stage >= 0)",
+            "stage0 AS (SELECT ip_address, session, MIN(timestamp) AS reached FROM staged WHERE stage = 0 GROUP BY ALL)",
+        ]
+        params = [None if gap is None else gap.total_seconds(), [str(url) for url in stages]] + params
+        for k in range(1, len(stages)):
+            ctes.append(
+                f"stage{k} AS (SELECT s.ip_address, s.session, MIN(s.timestamp) AS reached FROM staged s "
+                f"JOIN stage{k - 1} p USING (ip_address, session) WHERE s.stage = {k} AND s.timestamp >= p.reached "
+                f"GROUP BY ALL)"
+            )
+        counts = ', '.join(['COUNT(*) AS stage0'] + [f"COUNT(stage{k}.session) AS stage{k}" for k in range(1, len(stages))])
+        joins = ' '.join(f"LEFT JOIN stage{k} USING (ip_address, session)" for k in range(1, len(stages)))
+        result = self.query(
+            f"WITH {', '.join(ctes)} SELECT date_trunc('month', stage0.reached) AS month, {counts} "
+            f"FROM stage0 {joins} GROUP BY ALL ORDER BY month",
+            params
+        )
+        result['month'] = result['month'].astype('datetime64[ns]')
+        return result
+
+    def network_summary(self, ranges, filters=None):
+        """
+        Requests and distinct addresses per address range, over all
+        addresses, and the requests without an address.
+        Args:
+            ranges (list): (first, last) packed addresses, inclusive.
+        Returns:
+            pd.Series: requests0, customers0, ..., requests, customers, missing.
+        """
+        where, params = where_clause(filters)
+        columns = []
+        range_params = []
+        for k, (first, last) in enumerate(ranges):
+            columns.append(f"COUNT(*) FILTER (WHERE ip_address BETWEEN ? AND ?) AS requests{k}")
+            columns.append(f"COUNT(DISTINCT ip_address) FILTER (WHERE ip_address BETWEEN ? AND ?) AS customers{k}")
+            range_params.extend([first, last, first, last])
+        columns.extend([
+            "COUNT(ip_address) AS requests",
+            "COUNT(DISTINCT ip_address) AS customers",
+            "COUNT(*) - COUNT(ip_address) AS missing",
+        ])
+        return self.query(f"SELECT {', '.join(columns)} FROM log {where}", range_params + params).iloc[0]
+
+    def subnet_counts(self, bits=24, n=10, filters=None, bounds=None):
+        """
+        The n subnets of the given prefix length with the most requests,
+        ties in address order.
+        Args:
+            bounds (tuple): Optional (first, last) packed addresses; only
+                count addresses in that range.
+        Returns:
+            pd.DataFrame: subnet (first packed address), requests, customers.
+        """
+        where, params = where_clause(filters)
+        where = f"{where} AND" if where else "WHERE"
+        where += " ip_address IS NOT NULL"
+        if bounds is not None:
+            where += " AND ip_address BETWEEN ? AND ?"
+            params += list(bounds)
+        shift = 32 - int(bits)
+        return self.query(
+            f"SELECT (ip_address >> {shift}) << {shift} AS subnet, COUNT(*) AS requests, "
+            f"COUNT(DISTINCT ip_address) AS customers FROM log {where} "
+            f"GROUP BY ALL ORDER BY requests DESC, subnet LIMIT {int(n)}",
+            params
+        )
+
+    def distinct_ips(self, filters=None, months=None):
+        """
+        Number of distinct ip_address values. DuckDB counts them exactly: the
+        hash set only holds the distinct addresses, and its
+        approx_count_distinct() is too coarse at a few thousand customers.
+        """
+        where, params = where_clause(filters, months)
+        result = self.query(f"SELECT COUNT(DISTINCT ip_address) AS ips FROM log {where}", params)
+        return int(result['ips'].iloc[0])
+
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def _cached_query(_backend, version, sql, params):
+    # A cursor is a separate connection to the same database, safe to use
+    # from the thread running this session.
+    with _backend.connection.cursor() as cursor:
+        return cursor.execute(sql, list(params)).df()
+
+
+@st.cache_resource(max_entries=1)
+def _backend_for_version(version):
+    return DuckDBBackend(version)
+
+
+def get_duckdb_backend():
+    """
+    The DuckDB backend for the current data version, shared by all pages.
+    """
+    return _backend_for_version(data_version())
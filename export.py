@@ -0,0 +1,151 @@
+"""
+Lazy, chunked export of the filtered log.
+
+The download buttons defer serialization until they are clicked, so page
+reruns never build the export. On click the matching rows are written to a
+file under .exports/ in chunks of CHUNK_ROWS, keeping memory bounded by the
+chunk size, and the file is kept for the next download of the same data
+version, filters and format. With the DuckDB backend, DuckDB's COPY streams
+the rows from the Parquet store into the file instead.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+
+import pyarrow as pa  # type: ignore
+import pyarrow.parquet as pq  # type: ignore
+import streamlit as st  # type: ignore
+
+from data_loader import data_version, load_data
+from filter_index import filter_signature, get_filter_index
+from ip_index import format_ips
+from query_backend import get_backend, in_memory
+
+EXPORT_DIR = '.exports'
+CHUNK_ROWS = 250_000
+MAX_EXPORTS = 16
+
+# Format label -> (file extension, MIME type)
+FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def export_path(version, signature, fmt, export_dir=EXPORT_DIR):
+    """
+    Where the export of one data version / filter selection / format lives.
+    """
+    digest = hashlib.sha256(repr((version, signature, fmt)).encode()).hexdigest()[:32]
+    return os.path.join(export_dir, f"{digest}.{FORMATS[fmt][0]}")
+
+
+def _chunks(df, rows, chunk_rows=CHUNK_ROWS):
+    total = len(df) if rows is None else len(rows)
+    for start in range(0, total, chunk_rows):
+        if rows is None:
+            yield format_ips(df.iloc[start:start + chunk_rows])
+        else:
+            yield format_ips(df.take(rows[start:start + chunk_rows]))
+
+
+def write_export(df, rows, path, fmt, chunk_rows=CHUNK_ROWS):
+    """
+    Writes the given rows of df to path, one chunk at a time.
+    Args:
+        df (pd.DataFrame): The log frame.
+        rows (np.ndarray | None): Row positions to export, None for all rows.
+        path (str): Output file.
+        fmt (str): A FORMATS label.
+    """
+    if fmt == 'Parquet':
+        writer = None
+        try:
+            for chunk in _chunks(df, rows, chunk_rows):
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            if writer is None:
+                pq.write_table(pa.Table.from_pandas(format_ips(df.iloc[:0]), preserve_index=False), path)
+        finally:
+            if writer is not None:
+                writer.close()
+        return
+    opener = gzip.open if fmt == 'CSV (gzip)' else open
+    with opener(path, 'wt', newline='') as f:
+        header = True
+        for chunk in _chunks(df, rows, chunk_rows):
+            chunk.to_csv(f, index=False, header=header)
+            header = False
+        if header:
+            format_ips(df.iloc[:0]).to_csv(f, index=False)
+
+
+def _prune(export_dir=EXPORT_DIR, keep=MAX_EXPORTS):
+    files = [os.path.join(export_dir, name) for name in os.listdir(export_dir) if not name.startswith('.')]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for path in files[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def build_export(write, path):
+    """
+    Returns the export file opened for reading, writing it first unless an
+    earlier download already did. The download button reads it from disk,
+    so the export is never held in memory here.
+    Args:
+        write (callable): Writes the export to the path it is given.
+        path (str): Where the export is kept, see export_path().
+    """
+    if os.path.isfile(path):
+        # Mark as recently used so pruning keeps it.
+        os.utime(path)
+    else:
+        export_dir = os.path.dirname(path)
+        os.makedirs(export_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=export_dir, prefix='.', suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _prune(export_dir)
+    return open(path, 'rb')
+
+
+def export_button(filters, file_stem='filtered_data', key='export', label='Export Data'):
+    """
+    Renders a format picker and a download button for the rows matching the
+    filters. Nothing is serialized until the button is clicked.
+    Args:
+        filters (dict): Column -> selected values, as used for the page.
+        file_stem (str): Download file name without extension.
+        key (str): Widget key prefix, unique per page.
+        label (str): Button label; the format is appended.
+    """
+    fmt = st.selectbox("Export format", list(FORMATS), key=f"{key}_format")
+    extension, mime = FORMATS[fmt]
+    path = export_path(data_version(), filter_signature(filters), fmt)
+    if in_memory():
+        index = get_filter_index()
+        # The matching rows are only looked up when the button is clicked.
+        write = lambda tmp_path: write_export(load_data(), index.rows(filters), tmp_path, fmt)
+    else:
+        backend = get_backend()
+        write = lambda tmp_path: backend.copy_to(tmp_path, extension, filters)
+    return st.download_button(
+        f"{label} as {fmt}",
+        data=lambda: build_export(write, path),
+        file_name=f"{file_stem}.{extension}",
+        mime=mime,
+        key=f"{key}_download",
+        on_click='ignore',
+    )
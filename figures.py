@@ -0,0 +1,250 @@
+"""
+Memoized Plotly figure builders.
+
+Every builder is a pure function of the aggregated data it plots, so its
+result can be reused for as long as that data is unchanged. Builders are
+wrapped in memoize_figure(), which keys a bounded LRU cache on a hash of the
+arguments' contents: a rerun that leaves a chart's aggregate untouched gets
+the previously built figure back instead of constructing a new one.
+
+Cached figures are shared between reruns and sessions, so callers must not
+modify them; any styling belongs in the builder.
+"""
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px  # type: ignore
+import plotly.graph_objects as go  # type: ignore
+
+MAX_FIGURES = 128
+
+
+def fingerprint(value):
+    """
+    Hashable digest of a builder argument, by content for pandas and NumPy
+    data and recursively for containers.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        hashed = pd.util.hash_pandas_object(value, index=not isinstance(value, pd.Index))
+        digest = hashlib.sha1(hashed.to_numpy().tobytes()).hexdigest()
+        names = tuple(map(str, value.columns)) if isinstance(value, pd.DataFrame) else value.name
+        index_names = None if isinstance(value, pd.Index) else tuple(map(str, value.index.names))
+        return type(value).__name__, value.shape, names, index_names, digest
+    if isinstance(value, np.ndarray):
+        return 'ndarray', value.shape, value.dtype.str, hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+    if isinstance(value, dict):
+        return 'dict', tuple(sorted((str(k), fingerprint(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(fingerprint(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return 'repr', repr(value)
+    return value
+
+
+def memoize_figure(maxsize=MAX_FIGURES):
+    """
+    Decorator caching a figure builder's results in a thread-safe LRU keyed on
+    fingerprint() of its arguments.
+    """
+    def decorator(builder):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(builder)
+        def wrapper(*args, **kwargs):
+            key = (fingerprint(args), fingerprint(kwargs))
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    return cache[key]
+            figure = builder(*args, **kwargs)
+            with lock:
+                cache[key] = figure
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return figure
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+
+@memoize_figure()
+def px_figure(kind, data=None, layout=None, traces=None, **kwargs):
+    """
+    Builds a Plotly Express chart and applies its styling.
+    Args:
+        kind (str): Plotly Express function name, e.g. 'bar', 'line' or 'pie'.
+        data (pd.DataFrame | pd.Series): Data frame argument, if any.
+        layout (dict): Keyword arguments for fig.update_layout().
+        traces (dict): Keyword arguments for fig.update_traces().
+        **kwargs: Passed to the Plotly Express function.
+    Returns:
+        go.Figure
+    """
+    fig = getattr(px, kind)(data, **kwargs)
+    if traces:
+        fig.update_traces(**traces)
+    if layout:
+        fig.update_layout(**layout)
+    return fig
+
+
+@memoize_figure()
+def yearly_sales_comparison(month_labels, last_year_sales, this_year_sales, sales_target, current_year, last_year):
+    """
+    This year's vs last year's monthly sales with last year's average as the target.
+    """
+    fig = go.Figure()
+
+    # Last year (blue)
+    fig.add_trace(go.Scatter(
+        x=month_labels,
+        y=last_year_sales,
+        mode='lines+markers',
+        name=f'{last_year} Sales',
+        line=dict(color='royalblue', width=3),
+        marker=dict(color='royalblue')
+    ))
+
+    # This year (green, only up to May)
+    fig.add_trace(go.Scatter(
+        x=month_labels,
+        y=this_year_sales,
+        mode='lines+markers',
+        name=f'{current_year} Sales',
+        line=dict(color='green', width=3),
+        marker=dict(color='green')
+    ))
+
+    # Sales target (red dashed)
+    fig.add_trace(go.Scatter(
+        x=month_labels,
+        y=[sales_target]*12,
+        mode='lines',
+        name='Sales Target (Last Year Avg)',
+        line=dict(color='red', width=2, dash='dash')
+    ))
+
+    fig.update_layout(
+        title=f'Monthly Sales: {current_year} vs {last_year}',
+        xaxis_title='Month',
+        yaxis_title='Total Sales',
+        legend_title_text='',
+        margin=dict(l=20, r=20, t=40, b=40),
+        xaxis=dict(tickmode='array', tickvals=month_labels, tickangle=45)
+    )
+    return fig
+
+
+@memoize_figure()
+def sales_target_bar(sales_summary, sales_target):
+    """
+    Total sales per salesperson with the sales target as a red dashed line.
+    """
+    fig = px.bar(
+        sales_summary,
+        x='salesperson',
+        y='total_sales',
+        color='total_sales',
+        color_continuous_scale='viridis',
+        labels={'total_sales': 'Total Sales Amount', 'salesperson': 'Salesperson'},
+        title='Total Sales by Salesperson'
+    )
+
+    # Add sales target as a red dashed line
+    fig.add_shape(
+        type="line",
+        x0=-0.5,
+        x1=len(sales_summary['salesperson']) - 0.5,
+        y0=sales_target,
+        y1=sales_target,
+        line=dict(color="red", width=2, dash="dash"),
+        xref="x",
+        yref="y"
+    )
+    fig.add_annotation(
+        x=len(sales_summary['salesperson']) - 1,
+        y=sales_target,
+        text=f"Sales Target (${sales_target:,.0f})",
+        showarrow=False,
+        yshift=10,
+        font=dict(color="red", size=12),
+        align="right"
+    )
+    return fig
+
+
+@memoize_figure()
+def monthly_forecast_chart(actuals_df, forecast_df):
+    """
+    Monthly actuals followed by the forecast months.
+    """
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=actuals_df['month'],
+        y=actuals_df['cost'],
+        mode='lines+markers',
+        name='Actual Sales',
+        line=dict(color='royalblue', width=3, dash='solid'),
+        marker=dict(color='royalblue')
+    ))
+
+    # Forecasts: every month in the forecast file (forecasting.py writes the months after the last actual)
+    if not forecast_df.empty:
+        fig.add_trace(go.Scatter(
+            x=forecast_df['month'],
+            y=forecast_df['forecast'],
+            mode='lines+markers',
+            name='Forecast',
+            line=dict(color='orange', width=3, dash='dash'),
+            marker=dict(color='orange')
+        ))
+
+    fig.update_layout(
+        title='Monthly Sales: Actual vs Forecast',
+        xaxis_title='Month',
+        yaxis_title='Sales',
+        legend_title_text='',
+        xaxis_tickformat='%Y-%m',
+        xaxis_tickangle=45,
+        margin=dict(l=20, r=20, t=40, b=40)
+    )
+    return fig
+
+
+@memoize_figure()
+def weekly_forecast_chart(last_actuals, next_forecast):
+    """
+    Recent weekly actuals followed by the forecast weeks.
+    """
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=last_actuals['week_start'],
+        y=last_actuals['cost'],
+        mode='lines+markers',
+        name='Actual',
+        line=dict(color='royalblue')
+    ))
+    fig.add_trace(go.Scatter(
+        x=next_forecast['week_start'],
+        y=next_forecast['forecast'],
+        mode='lines+markers',
+        name='Forecast',
+        line=dict(color='orange', dash='dash')
+    ))
+    fig.update_layout(
+        xaxis_title="Week",
+        yaxis_title="Sales",
+        xaxis_tickformat='%Y-%m-%d',
+        legend_title_text='',
+        margin=dict(l=20, r=20, t=40, b=40)
+    )
+    return fig
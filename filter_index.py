@@ -0,0 +1,135 @@
+"""
+Bitmap index over the categorical columns of the log.
+
+Each (column, value) pair has a packed bitmap of the rows holding that value.
+A sidebar filter is answered by OR-ing the bitmaps of the selected values and
+AND-ing across columns, which touches n_rows / 8 bytes per bitmap instead of
+comparing strings row by row. Results are row positions; callers take only
+the columns they need.
+"""
+import numpy as np
+import streamlit as st  # type: ignore
+
+from data_loader import data_version, load_data
+
+
+class FilterIndex:
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.bitmaps = {}
+        for column in df.columns:
+            if df[column].dtype.name != 'category':
+                continue
+            codes = df[column].cat.codes.to_numpy()
+            self.bitmaps[column] = {
+                value: np.packbits(codes == code)
+                for code, value in enumerate(df[column].cat.categories)
+            }
+
+    def values(self, column):
+        return list(self.bitmaps[column])
+
+    def _column_bitmap(self, column, selected):
+        bitmaps = self.bitmaps[column]
+        selected = set(selected)
+        if selected >= set(bitmaps):
+            # Every value selected: the column doesn't restrict anything.
+            return None
+        chosen = [bitmaps[value] for value in selected if value in bitmaps]
+        if not chosen:
+            return np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+        return np.bitwise_or.reduce(chosen)
+
+    def bitmap(self, filters=None):
+        """
+        Packed bitmap (np.packbits order) of the rows matching all filters.
+        Args:
+            filters (dict): Column -> selected values. Missing or None means all.
+        Returns:
+            np.ndarray | None: uint8 bitmap, or None when no filter restricts
+            the rows.
+        """
+        combined = None
+        for column, selected in (filters or {}).items():
+            if selected is None:
+                continue
+            bitmap = self._column_bitmap(column, selected)
+            if bitmap is None:
+                continue
+            combined = bitmap if combined is None else combined & bitmap
+        return combined
+
+    def rows(self, filters=None):
+        """
+        Row positions matching all filters.
+        Args:
+            filters (dict): Column -> selected values. Missing or None means all.
+        Returns:
+            np.ndarray | None: Sorted row positions, or None when no filter
+            restricts the rows (use the full frame as-is, no copy needed).
+        """
+        combined = self.bitmap(filters)
+        if combined is None:
+            return None
+        return np.flatnonzero(np.unpackbits(combined, count=self.n_rows))
+
+    @staticmethod
+    def contains(bitmap, positions):
+        """
+        Whether each of the given row positions is set in a packed bitmap, at
+        a cost proportional to the number of positions.
+        """
+        return ((bitmap[positions >> 3] >> (7 - (positions & 7))) & 1).astype(bool)
+
+    def count(self, filters=None):
+        rows = self.rows(filters)
+        return self.n_rows if rows is None else len(rows)
+
+    @staticmethod
+    def take(data, rows):
+        """
+        Subset of a frame or column at the given rows. The input is returned
+        untouched when rows is None.
+        """
+        if rows is None:
+            return data
+        return data.take(rows)
+
+    @staticmethod
+    def latest(df, rows, n, column='timestamp'):
+        """
+        Positions of the n rows with the latest values of a column among the
+        given rows (all rows when rows is None), latest first. Only that
+        column is read, so callers can take just the rows they show.
+        """
+        values = df[column].to_numpy()
+        if rows is not None:
+            values = values[rows]
+        if 0 < n < len(values):
+            top = np.argpartition(values, len(values) - n)[len(values) - n:]
+        else:
+            top = np.arange(len(values))[:n]
+        top = top[np.argsort(values[top], kind='stable')[::-1]]
+        return top if rows is None else rows[top]
+
+
+def filter_signature(filters):
+    """
+    Hashable, order-independent form of a filters dict, for cache keys.
+    """
+    return tuple(sorted(
+        (column, None if selected is None else tuple(sorted(map(str, selected))))
+        for column, selected in (filters or {}).items()
+    ))
+
+
+@st.cache_resource(max_entries=1)
+def _index_for_version(version):
+    return FilterIndex(load_data())
+
+
+def get_filter_index():
+    """
+    The filter index for the current data version, shared by all pages.
+    """
+    return _index_for_version(data_version())
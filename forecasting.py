@@ -0,0 +1,377 @@
+"""
+Batch Holt-Winters forecasting for the Sales Team page.
+
+Groups the log once, fits every series (overall, per salesperson, per product,
+per country, plus the overall weekly series) on a process pool and writes all
+forecast files in one pass:
+
+    monthly_actuals.parquet / monthly_forecast.parquet              overall
+    monthly_actuals_<salesperson>.parquet / monthly_forecast_<salesperson>.parquet
+    monthly_actuals_product_<product>.parquet / monthly_forecast_product_<product>.parquet
+    monthly_actuals_country_<country>.parquet / monthly_forecast_country_<country>.parquet
+    weekly_outputs/weekly_actuals.parquet / weekly_outputs/weekly_forecast.parquet
+
+The files are typed: monthly files have a 'month' datetime column (first day
+of the month), weekly files a 'week_start' datetime column next to the 'week'
+label. load_monthly() and load_weekly() read them for the Sales Team page,
+cached until a file changes, and fall back to the CSV files written by
+Sales_Forecast.ipynb.
+
+Fits are incremental: forecast_store.json records a fingerprint of each
+series' monthly/weekly totals and its fitted Holt-Winters parameters. Series
+whose totals haven't changed since the last run are skipped, and changed ones
+are refit starting from their previous parameters.
+
+Usage:
+
+    python forecasting.py [--workers N] [--horizon 6] [--force]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st  # type: ignore
+
+from data_loader import read_log
+
+WEEKLY_DIR = 'weekly_outputs'
+STORE_FILE = 'forecast_store.json'
+
+MONTHLY_SEASON = 12
+WEEKLY_SEASON = 52
+DEFAULT_HORIZON = 6
+
+# Series grouped by a column get that column's prefix in their file names.
+# Salesperson files keep their original, unprefixed names.
+GROUPINGS = {
+    'salesperson': '',
+    'product_sold': 'product_',
+    'customer_country': 'country_',
+}
+
+
+class SeriesSpec:
+    """
+    One series to fit: its name, the period-indexed totals and where the
+    results go.
+    """
+    def __init__(self, key, series, season, actuals_file, forecast_file):
+        self.key = key
+        self.series = series
+        self.season = season
+        self.actuals_file = actuals_file
+        self.forecast_file = forecast_file
+        self.start_params = None
+
+    def fingerprint(self, horizon):
+        """
+        Hash of everything the fit depends on: the period totals, the season
+        and the forecast horizon.
+        """
+        digest = hashlib.sha256()
+        digest.update(f'{self.season}|{horizon}|{self.series.index[0] if len(self.series) else ""}'.encode())
+        digest.update(np.round(self.series.to_numpy(dtype=np.float64), 2).tobytes())
+        return digest.hexdigest()
+
+    @property
+    def freq(self):
+        return 'W' if self.season == WEEKLY_SEASON else 'M'
+
+    @property
+    def period_column(self):
+        return 'week' if self.season == WEEKLY_SEASON else 'month'
+
+
+def _monthly_files(suffix):
+    return f'monthly_actuals{suffix}.parquet', f'monthly_forecast{suffix}.parquet'
+
+
+def _weekly_files():
+    return os.path.join(WEEKLY_DIR, 'weekly_actuals.parquet'), os.path.join(WEEKLY_DIR, 'weekly_forecast.parquet')
+
+
+def _complete(series, freq):
+    """
+    Reindexes a period series over its full range, filling empty periods with 0.
+    """
+    if series.empty:
+        return series
+    periods = pd.period_range(series.index.min(), series.index.max(), freq=freq)
+    return series.reindex(periods, fill_value=0.0)
+
+
+def complete_periods(series, last_sale):
+    """
+    The series without its last period if the log ends before that period
+    does, so a partial week or month isn't fit or scored as a full one.
+    Args:
+        series (pd.Series): Period-indexed totals.
+        last_sale (pd.Timestamp): Latest date_of_sale in the log.
+    """
+    if len(series) and series.index[-1].end_time - last_sale >= pd.Timedelta(days=1):
+        return series.iloc[:-1]
+    return series
+
+
+def build_specs(df):
+    """
+    Builds every series to forecast from one pass over the log. Only complete
+    periods are kept; backtest.py scores the same series.
+    Returns:
+        list[SeriesSpec]
+    """
+    months = df['date_of_sale'].dt.to_period('M').rename('month')
+    weeks = df['date_of_sale'].dt.to_period('W').rename('week')
+    cost = df['cost']
+    last_sale = df['date_of_sale'].max()
+
+    def periods(series, freq):
+        return complete_periods(_complete(series, freq), last_sale)
+
+    specs = [
+        SeriesSpec('overall', periods(cost.groupby(months).sum(), 'M'), MONTHLY_SEASON, *_monthly_files('')),
+        SeriesSpec('weekly', periods(cost.groupby(weeks).sum(), 'W'), WEEKLY_SEASON, *_weekly_files()),
+    ]
+    for column, prefix in GROUPINGS.items():
+        grouped = cost.groupby([df[column], months], observed=True).sum().unstack(column)
+        for value in grouped.columns:
+            series = grouped[value].dropna()
+            specs.append(SeriesSpec(
+                f'{column}={value}', periods(series, 'M'), MONTHLY_SEASON,
+                *_monthly_files(f'_{prefix}{value}')
+            ))
+    return specs
+
+
+def param_vector(fit):
+    """
+    Fitted parameters in the order ExponentialSmoothing.fit(start_params=...)
+    expects for an additive trend + seasonal model.
+    """
+    params = fit.params
+    return [
+        float(params['smoothing_level']),
+        float(params['smoothing_trend']),
+        float(params['smoothing_seasonal']),
+        float(params['initial_level']),
+        float(params['initial_trend']),
+        *map(float, params['initial_seasons']),
+    ]
+
+
+def fit_series(spec, horizon=DEFAULT_HORIZON):
+    """
+    Fits additive Holt-Winters to one series, warm-started from
+    spec.start_params when available. Runs in a worker process.
+    Returns:
+        tuple: (spec, actuals DataFrame, forecast DataFrame, fitted parameters),
+        or (spec, None, None, None) when there are fewer than two seasonal
+        cycles of data.
+    """
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing  # type: ignore
+
+    series = spec.series
+    if len(series) < 2 * spec.season:
+        return spec, None, None, None
+    model = ExponentialSmoothing(
+        series.to_numpy(),
+        trend='add',
+        seasonal='add',
+        seasonal_periods=spec.season
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        fit = None
+        if spec.start_params is not None:
+            try:
+                # Warm start: skip the brute-force grid search.
+                fit = model.fit(start_params=np.asarray(spec.start_params), use_brute=False)
+            except Exception:
+                fit = None
+        if fit is None:
+            fit = model.fit()
+    column = spec.period_column
+    actuals = pd.DataFrame({column: series.index, 'cost': series.to_numpy(), 'forecast': fit.fittedvalues})
+    forecast = pd.DataFrame({
+        column: pd.period_range(series.index[-1] + 1, periods=horizon, freq=spec.freq),
+        'forecast': fit.forecast(horizon),
+    })
+    return spec, actuals, forecast, param_vector(fit)
+
+
+def _typed(frame, column):
+    """
+    Replaces a period column with native dates: 'month' becomes the first day
+    of the month, 'week' gets a 'week_start' date and keeps its label.
+    """
+    periods = pd.PeriodIndex(frame[column])
+    typed = frame.drop(columns=column)
+    if column == 'week':
+        typed.insert(0, 'week', periods.astype(str))
+        typed.insert(0, 'week_start', periods.start_time)
+    else:
+        typed.insert(0, column, periods.to_timestamp())
+    return typed
+
+
+def write_outputs(spec, actuals, forecast):
+    directory = os.path.dirname(spec.actuals_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    column = spec.period_column
+    for frame, path in ((actuals, spec.actuals_file), (forecast, spec.forecast_file)):
+        tmp_path = path + '.tmp'
+        _typed(frame, column).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+
+def load_store(path=STORE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'series': {}}
+
+
+def save_store(store, path=STORE_FILE):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(store, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _is_current(spec, entry, fingerprint):
+    return (
+        entry is not None
+        and entry.get('fingerprint') == fingerprint
+        and os.path.isfile(spec.actuals_file)
+        and os.path.isfile(spec.forecast_file)
+    )
+
+
+def run(workers=None, horizon=DEFAULT_HORIZON, df=None, force=False):
+    """
+    Refits every series whose totals changed since the last run and writes
+    their forecast files.
+    Args:
+        workers (int): Worker processes, one per core by default.
+        horizon (int): Periods to forecast ahead.
+        df (pd.DataFrame): Log to use instead of reading the Parquet store.
+        force (bool): Refit every series from scratch.
+    Returns:
+        dict: Series key -> 'refit', 'unchanged' or 'skipped' (not enough data).
+    """
+    if df is None:
+        df = read_log(columns=['date_of_sale', 'cost', *GROUPINGS])
+    store = {'series': {}} if force else load_store()
+    status = {}
+    stale = []
+    fingerprints = {}
+    for spec in build_specs(df):
+        entry = store['series'].get(spec.key)
+        fingerprints[spec.key] = spec.fingerprint(horizon)
+        if _is_current(spec, entry, fingerprints[spec.key]):
+            status[spec.key] = 'unchanged'
+            continue
+        if entry is not None:
+            spec.start_params = entry.get('params')
+        stale.append(spec)
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for spec, actuals, forecast, params in pool.map(fit_series, stale, [horizon] * len(stale)):
+                if actuals is None:
+                    status[spec.key] = 'skipped'
+                    store['series'].pop(spec.key, None)
+                    continue
+                write_outputs(spec, actuals, forecast)
+                store['series'][spec.key] = {
+                    'fingerprint': fingerprints[spec.key],
+                    'params': params,
+                    'periods': len(spec.series),
+                    'fitted_at': datetime.now().isoformat(timespec='seconds'),
+                }
+                status[spec.key] = 'refit'
+        save_store(store)
+    return status
+
+
+def _read_csv_output(path):
+    """
+    Reads a CSV output of Sales_Forecast.ipynb into the typed layout.
+    """
+    frame = pd.read_csv(path)
+    if 'week' in frame.columns:
+        frame.insert(0, 'week_start', pd.to_datetime(frame['week'].str.split('/').str[0], format='%Y-%m-%d'))
+    elif 'month' in frame.columns:
+        frame['month'] = pd.to_datetime(frame['month'], format='%Y-%m')
+    return frame
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _read_output(path, mtime):
+    if path.endswith('.csv'):
+        return _read_csv_output(path)
+    return pd.read_parquet(path)
+
+
+def read_output(path):
+    """
+    Reads one forecast output file, cached until the file changes. A missing
+    .parquet file is looked up as .csv, the format of the notebook's outputs.
+    Returns:
+        pd.DataFrame | None: None if neither file exists.
+    """
+    for candidate in (path, os.path.splitext(path)[0] + '.csv'):
+        if os.path.isfile(candidate):
+            return _read_output(candidate, os.path.getmtime(candidate))
+    return None
+
+
+def _load_pair(actuals_file, forecast_file):
+    actuals = read_output(actuals_file)
+    forecast = read_output(forecast_file)
+    if actuals is None or forecast is None:
+        return None
+    return actuals, forecast
+
+
+def load_monthly(salesperson=None):
+    """
+    Monthly actuals and forecast, overall or for one salesperson.
+    Returns:
+        tuple | None: (actuals, forecast) DataFrames with a datetime 'month'
+        column, or None if the series hasn't been forecast.
+    """
+    return _load_pair(*_monthly_files('' if salesperson is None else f'_{salesperson}'))
+
+
+def load_weekly():
+    """
+    Overall weekly actuals and forecast.
+    Returns:
+        tuple | None: (actuals, forecast) DataFrames with a datetime
+        'week_start' column and the 'week' label, or None if not available.
+    """
+    return _load_pair(*_weekly_files())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per core).')
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON, help='Periods to forecast ahead.')
+    parser.add_argument('--force', action='store_true', help='Refit every series from scratch.')
+    args = parser.parse_args()
+    start = time.time()
+    status = run(workers=args.workers, horizon=args.horizon, force=args.force)
+    for key, state in status.items():
+        print(f"{key}: {state}")
+    refit = sum(state == 'refit' for state in status.values())
+    print(f"Refit {refit} of {len(status)} series in {time.time() - start:.2f}s")
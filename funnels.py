@@ -0,0 +1,245 @@
+"""
+Conversion funnels over the url paths of the log.
+
+Several site sections are two-step journeys, e.g. /demo-request followed by
+/demo-request/schedule. Requests are grouped into sessions per ip_address: a
+customer's requests sorted by time, split wherever two requests are further
+apart than the session gap. A session reaches a funnel stage when it requests
+the stage's url at or after the time it reached the previous stage.
+
+Everything is computed on sorted NumPy arrays. The sort by (ip_address,
+timestamp) and the session numbering are done once per data version and
+session gap; a funnel is then a few masks and np.unique() calls over the rows
+of its urls, cached per filter selection. With the DuckDB backend the same
+sessions and stages are computed in SQL over the Parquet store instead (see
+DuckDBBackend.funnel()).
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st  # type: ignore
+
+from data_loader import data_version, load_data
+from filter_index import filter_signature, get_filter_index
+from ip_index import valid_ips
+from query_backend import get_backend, in_memory
+
+# Funnel name -> url of each stage, in order.
+FUNNELS = {
+    'Demo request': ['/demo-request', '/demo-request/schedule'],
+    'Job prototype': ['/job-prototype', '/job-prototype/submit'],
+    'Events': ['/events', '/events/upcoming'],
+    'AI assistant': ['/ai-assistant', '/ai-assistant/chat'],
+}
+
+# Label -> largest gap between two requests of one session (None: no limit,
+# a session is the customer's whole history).
+SESSION_GAPS = {
+    '30 minutes': pd.Timedelta(minutes=30),
+    '1 day': pd.Timedelta(days=1),
+    '7 days': pd.Timedelta(days=7),
+    '30 days': pd.Timedelta(days=30),
+    'Whole customer history': None,
+}
+DEFAULT_GAP = '30 days'
+
+
+class Sessions:
+    """
+    The log's rows in (ip_address, timestamp) order with a session number per
+    row. Session numbers increase along that order; rows without an address
+    have session -1 and belong to no session.
+    """
+    def __init__(self, order, session, times):
+        self.order = order
+        self.session = session
+        self.times = times
+
+
+def sessionize(ips, timestamps, gap=None, valid=None):
+    """
+    Splits each customer's requests into sessions.
+    Args:
+        ips (array-like): ip_address of each row (any sortable dtype).
+        timestamps (array-like): datetime64 timestamp of each row.
+        gap (pd.Timedelta): Largest gap within a session, None for no limit.
+        valid (np.ndarray): Optional boolean mask of the rows with a known
+            address; the others get session -1.
+    Returns:
+        Sessions
+    """
+    ips = np.asarray(ips)
+    times = np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64)
+    order = _sort_order(ips, times)
+    sorted_ips = ips[order]
+    sorted_times = times[order]
+    starts = np.empty(len(order), dtype=bool)
+    starts[:1] = True
+    starts[1:] = sorted_ips[1:] != sorted_ips[:-1]
+    if gap is not None:
+        starts[1:] |= np.diff(sorted_times) > gap.value
+    session = np.cumsum(starts) - 1
+    if valid is not None:
+        session[~np.asarray(valid)[order]] = -1
+    return Sessions(order, session, sorted_times)
+
+
+def _sort_order(ips, times):
+    """
+    Row order by (ip, time). Log timestamps have whole seconds, so packed
+    uint32 addresses and seconds since the first request fit one uint64 key,
+    which sorts several times faster than np.lexsort.
+    """
+    if len(times) and ips.dtype == np.uint32:
+        offset = times - times.min()
+        seconds, fraction = np.divmod(offset, 1_000_000_000)
+        if not fraction.any() and seconds.max() < 1 << 32:
+            return np.argsort((ips.astype(np.uint64) << np.uint64(32)) | seconds.astype(np.uint64))
+    return np.lexsort((times, ips))
+
+
+def _first_per_session(session, times):
+    """
+    First row of each session among rows sorted by (session, time).
+    """
+    sessions, first = np.unique(session, return_index=True)
+    return sessions, times[first]
+
+
+def funnel(sessions, stage_codes, row_mask=None):
+    """
+    Counts the sessions reaching each stage of a funnel.
+    Args:
+        sessions (Sessions): From sessionize().
+        stage_codes (np.ndarray): Stage number of each log row (0 = first
+            stage), -1 for rows outside the funnel.
+        row_mask (np.ndarray): Optional boolean mask of the log rows to count.
+    Returns:
+        tuple: (list of sessions reaching each stage, DataFrame of the
+        sessions entering the funnel with their 'entered' time and the
+        'stages' they reached)
+    """
+    stage = stage_codes[sessions.order]
+    keep = (stage >= 0) & (sessions.session >= 0)
+    if row_mask is not None:
+        keep &= row_mask[sessions.order]
+    stage = stage[keep]
+    session = sessions.session[keep]
+    times = sessions.times[keep]
+
+    n_stages = int(stage_codes.max()) + 1 if len(stage_codes) else 0
+    reached, entered = _first_per_session(session[stage == 0], times[stage == 0])
+    depth = np.ones(len(reached), dtype=np.int64)
+    counts = [len(reached)]
+    current, current_times = reached, entered
+    for k in range(1, n_stages):
+        rows = stage == k
+        candidates, candidate_times = session[rows], times[rows]
+        # Position of each candidate's session among those that reached stage k-1.
+        slot = np.searchsorted(current, candidates)
+        slot_ok = slot < len(current)
+        slot_ok[slot_ok] = current[slot[slot_ok]] == candidates[slot_ok]
+        slot_ok[slot_ok] = candidate_times[slot_ok] >= current_times[slot[slot_ok]]
+        current, current_times = _first_per_session(candidates[slot_ok], candidate_times[slot_ok])
+        depth[np.searchsorted(reached, current)] = k + 1
+        counts.append(len(current))
+    entries = pd.DataFrame({'entered': entered.view('datetime64[ns]'), 'stages': depth})
+    return counts, entries
+
+
+def stage_codes(urls, stages):
+    """
+    Stage number of each row for a funnel's stage urls, -1 elsewhere.
+    Args:
+        urls (pd.Series): The log's url column (categorical).
+        stages (list): Stage urls in order.
+    """
+    categories = urls.cat.categories
+    lookup = np.full(len(categories) + 1, -1, dtype=np.int8)
+    for k, url in enumerate(stages):
+        position = categories.get_indexer([url])[0]
+        if position >= 0:
+            lookup[position] = k
+    # Code -1 (missing url) maps to the trailing -1.
+    return lookup[urls.cat.codes.to_numpy()]
+
+
+def stage_table(counts, stages):
+    """
+    Sessions per stage with the conversion from the previous stage and from
+    the first one, in percent.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    previous = np.concatenate([counts[:1], counts[:-1]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = np.where(previous > 0, counts / previous * 100, 0.0)
+        overall = np.where(counts[0] > 0, counts / counts[0] * 100, 0.0)
+    return pd.DataFrame({
+        'stage': stages,
+        'sessions': counts.astype(np.int64),
+        'step_conversion': step,
+        'overall_conversion': overall,
+    })
+
+
+def monthly_cohorts(entries, n_stages):
+    """
+    Sessions grouped by the month they entered the funnel, with how many
+    completed it and the completion rate in percent.
+    """
+    month = entries['entered'].dt.to_period('M').dt.to_timestamp().rename('month')
+    completed = entries['stages'] >= n_stages
+    cohorts = pd.DataFrame({'entered': month.groupby(month).size(), 'completed': completed.groupby(month).sum()})
+    return _with_conversion(cohorts.reset_index())
+
+
+def _with_conversion(cohorts):
+    cohorts['conversion'] = np.where(cohorts['entered'] > 0, cohorts['completed'] / cohorts['entered'] * 100, 0.0)
+    return cohorts
+
+
+@st.cache_resource(max_entries=2)
+def _sessions_for_version(version, gap_label):
+    df = load_data()
+    ips = df['ip_address'].to_numpy()
+    return sessionize(ips, df['timestamp'].to_numpy(), SESSION_GAPS[gap_label], valid_ips(ips))
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _funnel_for_version(version, name, gap_label, signature):
+    df = load_data()
+    stages = FUNNELS[name]
+    rows = get_filter_index().rows(dict(signature))
+    row_mask = None
+    if rows is not None:
+        row_mask = np.zeros(len(df), dtype=bool)
+        row_mask[rows] = True
+    counts, entries = funnel(_sessions_for_version(version, gap_label), stage_codes(df['url'], stages), row_mask)
+    return stage_table(counts, stages), monthly_cohorts(entries, len(stages))
+
+
+def get_funnel(name, filters=None, gap_label=DEFAULT_GAP):
+    """
+    Stage conversion and monthly cohorts of a funnel for the rows matching
+    the filters, cached per data version.
+    Args:
+        name (str): A FUNNELS key.
+        filters (dict): The page's sidebar filters.
+        gap_label (str): A SESSION_GAPS key.
+    Returns:
+        tuple: (stage_table() DataFrame, monthly_cohorts() DataFrame)
+    """
+    if not in_memory():
+        return _backend_funnel(name, filters, gap_label)
+    return _funnel_for_version(data_version(), name, gap_label, filter_signature(filters or {}))
+
+
+def _backend_funnel(name, filters, gap_label):
+    stages = FUNNELS[name]
+    by_month = get_backend().funnel(stages, filters, SESSION_GAPS[gap_label])
+    counts = [int(by_month[f'stage{k}'].sum()) for k in range(len(stages))]
+    cohorts = pd.DataFrame({
+        'month': by_month['month'],
+        'entered': by_month['stage0'].astype(np.int64),
+        'completed': by_month[f'stage{len(stages) - 1}'].astype(np.int64),
+    })
+    return stage_table(counts, stages), _with_conversion(cohorts)
@@ -0,0 +1,190 @@
+"""
+Synthetic web/sales log generator for load testing.
+
+Produces the same columns and distributions as the generator in
+CET333Maano.ipynb, but samples whole chunks at once with NumPy and streams
+them to disk, so memory stays bounded by the chunk size at any row count.
+
+Usage:
+
+    python generate_logs.py --rows 10000000 [--format csv|parquet] [--out PATH]
+                            [--chunk-size 1000000] [--seed 42]
+
+CSV output matches ai_solutions_web_sales_logs.csv. Parquet output is written
+directly as the partitioned dataset the dashboard reads (see ingest.py). Its
+manifest marks it as generated, so ingest keeps it even when a CSV is present;
+run `python ingest.py --force` to go back to the CSV.
+"""
+import argparse
+import hashlib
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow as pa  # type: ignore
+import pyarrow.compute as pc  # type: ignore
+import pyarrow.csv as pacsv  # type: ignore
+
+from ingest import CSV_FILE, LOG_SCHEMA, PARQUET_DIR, TIMESTAMP_FORMAT, store_lock, with_partition_columns, write_partitioned
+from ip_index import parse_network, unpack_ips
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+ip_ranges = [
+    '128.1.0.', '155.55.0.', '157.20.5.', '157.20.20.', '157.20.30.',
+    '192.168.1.', '10.0.0.', '172.16.0.'
+]
+# Packed first address of each range; the last octet is added per row.
+ip_bases = np.array([parse_network(prefix)[0] for prefix in ip_ranges], dtype=np.uint32)
+urls = [
+    '/ai-assistant', '/demo-request', '/pricing', '/events',
+    '/job-prototype', '/solutions', '/contact', '/about',
+    '/ai-assistant/chat', '/demo-request/schedule',
+    '/events/upcoming', '/job-prototype/submit'
+]
+url_weights = [0.25, 0.15, 0.12, 0.1, 0.08, 0.08, 0.06, 0.05, 0.03, 0.03, 0.03, 0.02]
+
+interaction_map = {
+    '/ai-assistant': 'AI Assistant Request',
+    '/ai-assistant/chat': 'AI Chat Initiated',
+    '/demo-request': 'Demo Inquiry',
+    '/demo-request/schedule': 'Demo Scheduled',
+    '/job-prototype': 'Job Prototype Inquiry',
+    '/job-prototype/submit': 'Job Prototype Submitted',
+    '/events': 'Event Inquiry',
+    '/events/upcoming': 'Event Registered',
+    '/pricing': 'Pricing Viewed',
+    '/solutions': 'Solutions Browsed',
+    '/contact': 'Contact Request',
+    '/about': 'About Page Viewed'
+}
+
+methods = ['GET', 'POST', 'PUT']
+method_weights = [0.85, 0.12, 0.03]
+status_codes = [200, 201, 301, 302, 304, 400, 403, 404, 500]
+status_weights = [0.82, 0.05, 0.03, 0.02, 0.02, 0.02, 0.015, 0.015, 0.01]
+salespeople = ['Maano', 'Bob', 'Charlie', 'Diana', 'Eve', 'Frank']
+salesperson_weights = [0.3, 0.2, 0.2, 0.15, 0.1, 0.05]
+products = ['AI Suite', 'DataPro', 'InsightX', 'VisionBot', 'CloudSync']
+product_weights = [0.35, 0.25, 0.2, 0.15, 0.05]
+countries = ['USA', 'UK', 'Germany', 'India', 'Canada', 'Australia']
+country_weights = [0.35, 0.25, 0.15, 0.12, 0.08, 0.05]
+job_types = ['Consultation', 'Integration', 'Support', 'Training', 'Demo']
+job_type_weights = [0.3, 0.25, 0.2, 0.15, 0.1]
+
+# Cost is drawn uniformly from one of these bands.
+cost_bands = np.array([[500, 1000], [1000, 2000], [2000, 3500], [3500, 5000]], dtype=np.float64)
+cost_band_weights = [0.4, 0.3, 0.2, 0.1]
+
+SPAN_DAYS = 1095  # 3 years, three full seasonal cycles
+
+
+def _choice(rng, n, weights):
+    p = np.asarray(weights, dtype=np.float64)
+    return rng.choice(len(p), size=n, p=p / p.sum()).astype(np.int32)
+
+
+def _dictionary(indices, values):
+    return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(values, pa.string()))
+
+
+def generate_batch(rng, n, start_ns):
+    """
+    Samples n log rows as an Arrow record batch with the ingest LOG_SCHEMA.
+    """
+    seconds = rng.integers(0, (SPAN_DAYS + 1) * 86400, size=n, dtype=np.int64)
+    timestamps = pa.array(start_ns + seconds * 1_000_000_000, pa.timestamp('ns'))
+
+    ip_prefix = ip_bases[rng.integers(0, len(ip_ranges), size=n)]
+    ip_address = pa.array(ip_prefix + rng.integers(1, 256, size=n).astype(np.uint32), pa.uint32())
+
+    url = _choice(rng, n, url_weights)
+    band = cost_bands[_choice(rng, n, cost_band_weights)]
+    cost = np.round(rng.uniform(band[:, 0], band[:, 1]), 2)
+
+    return pa.RecordBatch.from_arrays([
+        timestamps,
+        ip_address,
+        _dictionary(_choice(rng, n, method_weights), methods),
+        _dictionary(url, urls),
+        pa.array(np.asarray(status_codes, dtype=np.int16)[_choice(rng, n, status_weights)]),
+        _dictionary(_choice(rng, n, salesperson_weights), salespeople),
+        _dictionary(_choice(rng, n, product_weights), products),
+        timestamps,
+        pa.array(cost),
+        _dictionary(_choice(rng, n, country_weights), countries),
+        _dictionary(_choice(rng, n, job_type_weights), job_types),
+        _dictionary(url, [interaction_map[u] for u in urls]),
+    ], schema=LOG_SCHEMA)
+
+
+def generate_batches(rows, chunk_size=DEFAULT_CHUNK_SIZE, seed=42, end=None):
+    """
+    Yields record batches totalling `rows` rows, spanning SPAN_DAYS up to `end`.
+    """
+    rng = np.random.default_rng(seed)
+    end = (end or datetime.now()).replace(microsecond=0)
+    start_ns = np.datetime64(end - timedelta(days=SPAN_DAYS), 'ns').astype(np.int64)
+    for offset in range(0, rows, chunk_size):
+        yield generate_batch(rng, min(chunk_size, rows - offset), start_ns)
+
+
+def _csv_batch(batch):
+    # The dashboard CSV stores day-first text timestamps, dotted addresses
+    # and plain strings.
+    columns = []
+    for field, column in zip(batch.schema, batch.columns):
+        if field.name == 'ip_address':
+            column = pa.array(unpack_ips(column.to_numpy()), pa.string())
+        elif pa.types.is_timestamp(field.type):
+            column = pc.strftime(pc.cast(column, pa.timestamp('s')), format=TIMESTAMP_FORMAT)
+        elif pa.types.is_dictionary(field.type):
+            column = column.dictionary_decode()
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def write_csv(batches, path=CSV_FILE):
+    writer = None
+    try:
+        for batch in batches:
+            batch = _csv_batch(batch)
+            if writer is None:
+                writer = pacsv.CSVWriter(path, batch.schema, write_options=pacsv.WriteOptions(quoting_style='needed'))
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_parquet(batches, parquet_dir, rows, seed):
+    manifest = {
+        'source': 'generate_logs',
+        'generated': True,
+        'rows': rows,
+        'seed': seed,
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    # No CSV to hash: identify this dataset by how it was generated.
+    manifest['sha256'] = hashlib.sha256(repr(sorted(manifest.items())).encode()).hexdigest()
+    with store_lock(parquet_dir):
+        write_partitioned((with_partition_columns(batch) for batch in batches), manifest, parquet_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--out', default=None, help=f'Output path (default: {CSV_FILE} or {PARQUET_DIR}).')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    start = time.time()
+    batches = generate_batches(args.rows, args.chunk_size, args.seed)
+    if args.format == 'csv':
+        out = args.out or CSV_FILE
+        write_csv(batches, out)
+    else:
+        out = args.out or PARQUET_DIR
+        write_parquet(batches, out, args.rows, args.seed)
+    print(f"Wrote {args.rows:,} rows to {out} in {time.time() - start:.2f}s")
@@ -0,0 +1,120 @@
+"""
+Country name -> (lat, lon) lookups for the map panels.
+
+Coordinates come from the bundled country_centroids.csv gazetteer. Names it
+does not know are geocoded once through Nominatim and remembered in
+geocode_cache.json, so the maps never wait on the network for a country they
+have already seen. Only Nominatim's answers are remembered: a lookup that
+fails (timeout, no network) is retried after RETRY_SECONDS.
+"""
+import csv
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+GAZETTEER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'country_centroids.csv')
+CACHE_FILE = 'geocode_cache.json'
+
+# Set GEOCODE_OFFLINE=1 to never fall back to Nominatim for unknown names.
+OFFLINE = os.environ.get('GEOCODE_OFFLINE', '') not in ('', '0')
+
+# Seconds before a failed lookup of a name is tried again.
+RETRY_SECONDS = 300
+
+_lock = threading.Lock()
+_gazetteer = None
+_cache = None
+# Name -> time.monotonic() of its last failed lookup. Not persisted.
+_failed = {}
+
+
+def _key(country):
+    return str(country).strip().casefold()
+
+
+def _load_gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        with open(GAZETTEER_FILE, newline='', encoding='utf-8') as f:
+            _gazetteer = {
+                _key(row['country']): (float(row['lat']), float(row['lon']))
+                for row in csv.DictReader(f)
+            }
+    return _gazetteer
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(CACHE_FILE, encoding='utf-8') as f:
+                _cache = {k: tuple(v) if v else None for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save_cache(cache):
+    tmp_file = CACHE_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({k: list(v) if v else None for k, v in cache.items()}, f, indent=2)
+    os.replace(tmp_file, CACHE_FILE)
+
+
+def _geocode_online(country):
+    """
+    Asks Nominatim for a country's coordinates.
+    Returns:
+        tuple | None: (lat, lon), or None if Nominatim doesn't know the name.
+    Raises:
+        Exception: If the lookup itself failed, e.g. on a timeout.
+    """
+    from geopy.geocoders import Nominatim  # type: ignore
+    location = Nominatim(user_agent="country_locator").geocode(country)
+    if location:
+        return (location.latitude, location.longitude)
+    return None
+
+
+def get_country_latlon(country):
+    """
+    Looks up the approximate centre of a country.
+    Args:
+        country (str): Country name as it appears in the log, e.g. 'UK'.
+    Returns:
+        tuple: (lat, lon), or (None, None) if the country can't be located.
+    """
+    key = _key(country)
+    latlon = _load_gazetteer().get(key)
+    if latlon is not None:
+        return latlon
+    with _lock:
+        cache = _load_cache()
+        if key not in cache:
+            if OFFLINE or (key in _failed and time.monotonic() - _failed[key] < RETRY_SECONDS):
+                return (None, None)
+            try:
+                latlon = _geocode_online(country)
+            except Exception:
+                # Not an answer: don't remember it as a miss.
+                _failed[key] = time.monotonic()
+                return (None, None)
+            # Misses are cached too so an unknown name costs one request ever.
+            cache[key] = latlon
+            _failed.pop(key, None)
+            _save_cache(cache)
+    return cache[key] or (None, None)
+
+
+def add_latlon(frame, column='country'):
+    """
+    Returns a copy of frame with 'lat' and 'lon' columns for its country column.
+    """
+    coords = [get_country_latlon(country) for country in frame[column]]
+    return frame.assign(
+        lat=pd.Series([lat for lat, _ in coords], index=frame.index, dtype='float64'),
+        lon=pd.Series([lon for _, lon in coords], index=frame.index, dtype='float64'),
+    )
@@ -0,0 +1,71 @@
+"""
+Vectorized HyperLogLog sketches for approximate distinct counts.
+
+A sketch is a uint8 array of 2**p registers. Sketches for many cells are kept
+as the rows of one 2-D array; merging cells is an element-wise max over rows.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_PRECISION = 12  # 4096 registers, ~1.6% standard error
+
+
+def hash_values(values):
+    """
+    Hashes any column of values to uint64.
+    """
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+
+
+def _register_ranks(hashes, p):
+    index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - p)) - 1)
+    # Position of the highest set bit among the remaining 64 - p bits. frexp on
+    # the float value can round up to the next power of two, so correct that.
+    bit_length = np.frexp(rest.astype(np.float64))[1].astype(np.int64)
+    overshoot = (bit_length > 0) & ((rest >> np.maximum(bit_length - 1, 0).astype(np.uint64)) == 0)
+    bit_length -= overshoot
+    rank = (64 - p) - bit_length + 1
+    return index, rank.astype(np.uint8)
+
+
+def build_registers(hashes, cells, n_cells, p=DEFAULT_PRECISION):
+    """
+    Builds one sketch per cell.
+    Args:
+        hashes (np.ndarray): uint64 hash of each row's value.
+        cells (np.ndarray): Cell number (0..n_cells-1) of each row.
+        n_cells (int): Number of cells.
+        p (int): Precision; each sketch has 2**p registers.
+    Returns:
+        np.ndarray: uint8 array of shape (n_cells, 2**p).
+    """
+    registers = np.zeros((n_cells, 1 << p), dtype=np.uint8)
+    index, rank = _register_ranks(np.asarray(hashes, dtype=np.uint64), p)
+    np.maximum.at(registers, (np.asarray(cells, dtype=np.int64), index), rank)
+    return registers
+
+
+def merge(registers):
+    """
+    Merges a (n, 2**p) stack of sketches into one sketch.
+    """
+    if len(registers) == 0:
+        return None
+    return registers.max(axis=0)
+
+
+def estimate(sketch):
+    """
+    Estimates the number of distinct values seen by a sketch.
+    """
+    if sketch is None:
+        return 0
+    m = sketch.shape[0]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -sketch.astype(np.int64)))
+    zeros = int(np.count_nonzero(sketch == 0))
+    if raw <= 2.5 * m and zeros:
+        # Small-range correction (linear counting).
+        return int(round(m * np.log(m / zeros)))
+    return int(round(raw))
@@ -0,0 +1,480 @@
+"""
+Converts the web/sales log CSV into a Parquet dataset partitioned by year and
+month of sale. The dashboard reads the Parquet copy, which is kept in step with
+the CSV. ip_address is stored packed into a uint32 (see ip_index.py).
+
+The log is append-only, so the manifest remembers the byte offset up to which
+the CSV has been ingested. When the file grows, only the complete lines after
+that offset are parsed and written as a new segment of the dataset; the whole
+CSV is reparsed only when its already-ingested part changed.
+
+Run directly to (re)build the dataset ahead of time, or to keep following the
+CSV as it grows:
+
+    python ingest.py [--force] [--follow [--interval 2]]
+"""
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import pyarrow as pa  # type: ignore
+import pyarrow.compute as pc  # type: ignore
+import pyarrow.csv as pacsv  # type: ignore
+import pyarrow.dataset as ds  # type: ignore
+
+from ip_index import IP_COLUMN, pack_ips
+
+CSV_FILE = 'ai_solutions_web_sales_logs.csv'
+PARQUET_DIR = 'ai_solutions_web_sales_logs.parquet'
+MANIFEST_FILE = '_manifest.json'
+
+# Layout of the stored columns. A dataset written with another format is
+# rebuilt instead of appended to.
+STORE_FORMAT = 3
+
+# Bytes at the start of the CSV and just before the ingested offset that must
+# be unchanged for new lines to count as an append.
+EDGE_BYTES = 64 << 10
+
+# The generator in CET333Maano.ipynb writes day-first timestamps.
+TIMESTAMP_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+LOG_SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('ns')),
+    ('ip_address', pa.uint32()),
+    ('method', DICTIONARY),
+    ('url', DICTIONARY),
+    ('status_code', pa.int16()),
+    ('salesperson', DICTIONARY),
+    ('product_sold', DICTIONARY),
+    ('date_of_sale', pa.timestamp('ns')),
+    ('cost', pa.float64()),
+    ('customer_country', DICTIONARY),
+    ('job_type_requested', DICTIONARY),
+    ('customer_interaction', DICTIONARY),
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('year', pa.int16()), ('month', pa.int8())]),
+    flavor='hive'
+)
+
+# The CSV holds dotted addresses; csv_batches() packs them.
+CSV_TYPES = {field.name: field.type for field in LOG_SCHEMA}
+CSV_TYPES[IP_COLUMN] = pa.string()
+
+DATASET_SCHEMA = LOG_SCHEMA.append(pa.field('year', pa.int16())).append(pa.field('month', pa.int8()))
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(parquet_dir=PARQUET_DIR):
+    path = os.path.join(parquet_dir, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, parquet_dir=PARQUET_DIR):
+    path = os.path.join(parquet_dir, MANIFEST_FILE)
+    fd, tmp_path = tempfile.mkstemp(dir=parquet_dir, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        # Readers see either the old or the new manifest, never half of one.
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextlib.contextmanager
+def store_lock(parquet_dir=PARQUET_DIR):
+    """
+    Holds an exclusive lock on the dataset while it is built or appended to,
+    so server processes, the warmup thread and the CLI take turns writing it.
+    The lock is a file next to the dataset and is released if the holder dies.
+    """
+    with open(parquet_dir + '.lock', 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds; keep waiting.
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def source_fingerprint(csv_path):
+    stat = os.stat(csv_path)
+    return {'source': os.path.basename(csv_path), 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def edge_hash(csv_path, offset):
+    """
+    Hash of the first and last EDGE_BYTES of the CSV before `offset`. If it
+    still matches, bytes past the offset are taken to be appended rows.
+    """
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        digest.update(f.read(min(offset, EDGE_BYTES)))
+        f.seek(max(0, offset - EDGE_BYTES))
+        digest.update(f.read(min(offset, EDGE_BYTES)))
+    return digest.hexdigest()
+
+
+def is_up_to_date(csv_path=CSV_FILE, parquet_dir=PARQUET_DIR):
+    """
+    Checks whether the Parquet dataset still matches the CSV. The CSV is only
+    read when mtime or size moved, so an unchanged CSV costs one stat.
+    Returns:
+        bool: True if no rebuild or append is needed.
+    """
+    manifest = read_manifest(parquet_dir)
+    if manifest is None or manifest.get('format') != STORE_FORMAT:
+        return False
+    if manifest.get('generated'):
+        # Written by generate_logs.py, not from the CSV: kept until --force.
+        return True
+    current = source_fingerprint(csv_path)
+    if current['mtime'] == manifest.get('mtime') and current['size'] == manifest.get('size'):
+        return True
+    if (
+        current['size'] == manifest.get('size') == manifest.get('offset')
+        and edge_hash(csv_path, manifest['offset']) == manifest.get('edge_hash')
+    ):
+        # Touched but not modified: remember the new mtime and keep the data.
+        manifest.update(current)
+        write_manifest(manifest, parquet_dir)
+        return True
+    return False
+
+
+def with_partition_columns(batch):
+    sale_date = batch.column('date_of_sale')
+    return pa.RecordBatch.from_arrays(
+        batch.columns + [
+            pc.cast(pc.year(sale_date), pa.int16()),
+            pc.cast(pc.month(sale_date), pa.int8()),
+        ],
+        names=batch.schema.names + ['year', 'month']
+    )
+
+
+def csv_batches(csv_path, block_size=16 << 20, column_names=None):
+    """
+    Streams the CSV as typed Arrow record batches with packed addresses and
+    year/month columns added.
+    Args:
+        csv_path (str | file-like): The CSV, or a file object with CSV rows.
+        column_names (list): Column names when the input has no header row.
+    """
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=block_size, column_names=column_names),
+        convert_options=pacsv.ConvertOptions(
+            column_types=CSV_TYPES,
+            timestamp_parsers=[TIMESTAMP_FORMAT],
+            include_columns=LOG_SCHEMA.names,
+        )
+    )
+    for batch in reader:
+        ips = batch.schema.get_field_index(IP_COLUMN)
+        batch = pa.RecordBatch.from_arrays(
+            batch.columns[:ips] + [pack_ips(batch.column(ips))] + batch.columns[ips + 1:],
+            schema=LOG_SCHEMA
+        )
+        yield with_partition_columns(batch)
+
+
+def _segment_template(segment):
+    return f'seg{segment:05d}-{{i}}.parquet'
+
+
+def _write_segment(batches, directory, segment):
+    """
+    Writes record batches (with year/month columns) into the partition
+    directories as segment files.
+    Returns:
+        int: Rows written.
+    """
+    rows = 0
+
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += batch.num_rows
+            yield batch
+
+    ds.write_dataset(
+        counted(batches),
+        directory,
+        schema=DATASET_SCHEMA,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template=_segment_template(segment),
+        existing_data_behavior='overwrite_or_ignore',
+    )
+    return rows
+
+
+def write_partitioned(batches, manifest, parquet_dir=PARQUET_DIR):
+    """
+    Writes record batches (with year/month columns) as the partitioned dataset.
+    The new dataset is written into a private directory next to the old one and
+    swapped in at the end so readers never see a half-built directory. Callers
+    hold store_lock().
+    """
+    parent = os.path.dirname(os.path.abspath(parquet_dir))
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(parquet_dir) + '.', suffix='.tmp')
+    old_dir = tmp_dir + '.old'
+    try:
+        rows = _write_segment(batches, tmp_dir, 0)
+        manifest['format'] = STORE_FORMAT
+        manifest['rows'] = rows
+        manifest['segments'] = [{'id': 0, 'rows': rows, 'offset': manifest.get('offset'), 'sha256': manifest['sha256']}]
+        write_manifest(manifest, tmp_dir)
+        # Move the old dataset aside rather than deleting it in place, so the
+        # directory is only missing between the two renames.
+        if os.path.isdir(parquet_dir):
+            os.replace(parquet_dir, old_dir)
+        os.replace(tmp_dir, parquet_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def complete_lines_end(csv_path, size):
+    """
+    Offset just past the last newline in the first `size` bytes of the CSV,
+    so a line still being written is left for a later append.
+    """
+    with open(csv_path, 'rb') as f:
+        end = size
+        while end > 0:
+            start = max(0, end - EDGE_BYTES)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+class _LimitedReader(io.RawIOBase):
+    """
+    Read-only view of the first `limit` bytes of a binary file.
+    """
+    def __init__(self, f, limit):
+        self.f = f
+        self.remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.f.read(min(len(buffer), self.remaining))
+        self.remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def build_parquet(csv_path=CSV_FILE, parquet_dir=PARQUET_DIR):
+    """
+    Rewrites the Parquet dataset from the complete lines of the CSV.
+    """
+    manifest = source_fingerprint(csv_path)
+    manifest['sha256'] = file_hash(csv_path)
+    manifest['offset'] = complete_lines_end(csv_path, manifest['size'])
+    manifest['edge_hash'] = edge_hash(csv_path, manifest['offset'])
+    with open(csv_path, 'rb') as f:
+        source = io.BufferedReader(_LimitedReader(f, manifest['offset']))
+        return write_partitioned(csv_batches(source), manifest, parquet_dir)
+
+
+def _header_names(csv_path):
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+    return pacsv.read_csv(io.BytesIO(header), read_options=pacsv.ReadOptions(autogenerate_column_names=False)).column_names
+
+
+def append_tail(csv_path=CSV_FILE, parquet_dir=PARQUET_DIR):
+    """
+    Ingests the complete lines appended to the CSV since the last build or
+    append as a new segment of the dataset. Callers hold store_lock().
+    Returns:
+        int | None: Rows appended, or None when the CSV is not an append of
+        what was ingested (the dataset must be rebuilt instead).
+    """
+    manifest = read_manifest(parquet_dir)
+    if (
+        manifest is None or manifest.get('format') != STORE_FORMAT
+        or manifest.get('offset') is None or 'segments' not in manifest
+    ):
+        return None
+    offset = manifest['offset']
+    current = source_fingerprint(csv_path)
+    if current['size'] < offset or edge_hash(csv_path, offset) != manifest.get('edge_hash'):
+        return None
+    # Leave a partially written last line for the next call.
+    end = complete_lines_end(csv_path, current['size'])
+    with open(csv_path, 'rb') as f:
+        f.seek(offset)
+        tail = f.read(max(0, end - offset))
+    if not tail.strip():
+        manifest.update(current)
+        write_manifest(manifest, parquet_dir)
+        return 0
+
+    segment = manifest['segments'][-1]['id'] + 1
+    # Files left by an append that died before committing its manifest.
+    for path in segment_files([segment], parquet_dir):
+        os.remove(path)
+    rows = _write_segment(
+        csv_batches(io.BytesIO(tail), column_names=_header_names(csv_path)),
+        parquet_dir,
+        segment
+    )
+    offset += len(tail)
+    manifest.update(current)
+    manifest['sha256'] = hashlib.sha256(manifest['sha256'].encode() + tail).hexdigest()
+    manifest['offset'] = offset
+    manifest['edge_hash'] = edge_hash(csv_path, offset)
+    manifest['rows'] = manifest.get('rows', 0) + rows
+    manifest['segments'].append({'id': segment, 'rows': rows, 'offset': offset, 'sha256': manifest['sha256']})
+    # The manifest is written last: readers only read the segments it lists,
+    # so until then they keep the previous version.
+    write_manifest(manifest, parquet_dir)
+    return rows
+
+
+def ensure_parquet(csv_path=CSV_FILE, parquet_dir=PARQUET_DIR, force=False):
+    """
+    Builds the Parquet dataset if it is missing or stale, or appends the new
+    rows when the CSV only grew. Only one process or thread writes the dataset
+    at a time; the others wait and then find it up to date.
+    Returns:
+        bool: True if the dataset changed.
+    """
+    if not os.path.isfile(csv_path):
+        if os.path.isdir(parquet_dir):
+            return False
+        raise FileNotFoundError(csv_path)
+    if not force and is_up_to_date(csv_path, parquet_dir):
+        return False
+    with store_lock(parquet_dir):
+        if not force:
+            # Another writer may have built or appended while this one waited.
+            if is_up_to_date(csv_path, parquet_dir):
+                return False
+            appended = append_tail(csv_path, parquet_dir)
+            if appended is not None:
+                return appended > 0
+        build_parquet(csv_path, parquet_dir)
+    return True
+
+
+def manifest_segments(manifest):
+    """
+    Ids of the segments a manifest lists, i.e. the committed ones.
+    """
+    return [segment['id'] for segment in (manifest or {}).get('segments', [])]
+
+
+def segment_files(segments, parquet_dir=PARQUET_DIR):
+    """
+    Paths of the files of the given segments. Readers list the dataset's files
+    through the manifest rather than the directory, so files of an append that
+    hasn't committed its manifest yet, or died before it did, are never read.
+    Args:
+        segments (list[int]): Segment ids from the manifest.
+    """
+    return sorted(
+        path
+        for segment in segments
+        for path in glob.glob(os.path.join(parquet_dir, '**', f'seg{segment:05d}-*.parquet'), recursive=True)
+    )
+
+
+def log_dataset(parquet_dir=PARQUET_DIR, segments=None):
+    """
+    The dataset made of the given segments, by default those of the current
+    manifest.
+    """
+    if segments is None:
+        segments = manifest_segments(read_manifest(parquet_dir))
+    return ds.dataset(
+        segment_files(segments, parquet_dir), schema=DATASET_SCHEMA, format='parquet',
+        partitioning=PARTITIONING, partition_base_dir=parquet_dir
+    )
+
+
+def read_table(parquet_dir=PARQUET_DIR, columns=None, filter=None, segments=None):
+    """
+    Reads the log (or a subset of its columns/rows) as an Arrow table.
+    Args:
+        segments (list[int]): Only read these segments; by default all those
+            of the current manifest.
+    """
+    columns = columns or LOG_SCHEMA.names
+    return log_dataset(parquet_dir, segments).to_table(columns=columns, filter=filter)
+
+
+def read_segments(segments, parquet_dir=PARQUET_DIR, columns=None):
+    """
+    Reads only the given segments of the dataset as an Arrow table.
+    Args:
+        segments (list[int]): Segment ids from the manifest.
+    """
+    return read_table(parquet_dir, columns, segments=segments)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--csv', default=CSV_FILE)
+    parser.add_argument('--out', default=PARQUET_DIR)
+    parser.add_argument('--force', action='store_true', help='Rebuild even if the CSV is unchanged.')
+    parser.add_argument('--follow', action='store_true', help='Keep appending new CSV rows as they arrive.')
+    parser.add_argument('--interval', type=float, default=2.0, help='Seconds between checks with --follow.')
+    args = parser.parse_args()
+    changed = ensure_parquet(args.csv, args.out, force=args.force)
+    print(f"{args.out}: {'updated' if changed else 'up to date'} ({read_manifest(args.out).get('rows', 0):,} rows)")
+    while args.follow:
+        time.sleep(args.interval)
+        rows = read_manifest(args.out).get('rows', 0)
+        if ensure_parquet(args.csv, args.out):
+            print(f"{args.out}: +{read_manifest(args.out)['rows'] - rows:,} rows")
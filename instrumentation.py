@@ -0,0 +1,157 @@
+"""
+Per-section render timing for the dashboard pages.
+
+Report.py starts a timer before running the selected page and finishes it
+afterwards. Pages split their script into named sections with mark(), which
+ends the previous section and starts the next. Outside Report.py (a page run
+on its own) there is no timer and mark() is a no-op.
+
+What happens with the timings is chosen by an admin in the Report.py sidebar:
+
+    panel      a per-section breakdown in the sidebar
+    json_log   one JSON line per rerun appended to profiles/timings.jsonl
+    cprofile   a cProfile dump per rerun in profiles/<page>-<timestamp>.prof
+"""
+import cProfile
+import json
+import os
+import time
+from datetime import datetime
+
+import streamlit as st  # type: ignore
+
+PROFILE_DIR = 'profiles'
+TIMINGS_LOG = os.path.join(PROFILE_DIR, 'timings.jsonl')
+
+# Session state keys of the admin toggles in Report.py.
+SETTINGS = {
+    'panel': 'profiling_panel',
+    'json_log': 'profiling_json_log',
+    'cprofile': 'profiling_cprofile',
+}
+
+_TIMER_KEY = '_page_timer'
+
+
+class PageTimer:
+    """
+    Section timings for one run of one page.
+    """
+    def __init__(self, page, profile=False):
+        self.page = page
+        self.sections = []
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.current = None
+        self.profiler = cProfile.Profile() if profile else None
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def _record(self, name, start):
+        self.sections.append((name, time.perf_counter() - start))
+
+    def mark(self, name):
+        self.close_section()
+        self.current = (name, time.perf_counter())
+
+    def close_section(self):
+        if self.current is not None:
+            self._record(*self.current)
+            self.current = None
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def as_record(self):
+        return {
+            'page': self.page,
+            'started_at': self.started_at.isoformat(timespec='milliseconds'),
+            'total': round(self.total(), 6),
+            'sections': [{'name': name, 'seconds': round(seconds, 6)} for name, seconds in self.sections],
+        }
+
+
+def enabled(setting):
+    return bool(st.session_state.get(SETTINGS[setting], False))
+
+
+def current_timer():
+    return st.session_state.get(_TIMER_KEY)
+
+
+def start_page(page):
+    """
+    Starts timing a page run. Called by Report.py before pg.run().
+    """
+    stale = st.session_state.pop(_TIMER_KEY, None)
+    if stale is not None and stale.profiler is not None:
+        # The previous run stopped early (st.stop or a rerun) and never finished.
+        stale.profiler.disable()
+    timer = PageTimer(page, profile=enabled('cprofile'))
+    st.session_state[_TIMER_KEY] = timer
+    return timer
+
+
+def mark(name):
+    """
+    Ends the current section and starts the one called `name`.
+    """
+    timer = current_timer()
+    if timer is not None:
+        timer.mark(name)
+
+
+def _write_log(record):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(TIMINGS_LOG, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def _dump_profile(timer):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = timer.page.replace(' ', '_').replace('&', 'and')
+    path = os.path.join(PROFILE_DIR, f"{name}-{timer.started_at:%Y%m%dT%H%M%S%f}.prof")
+    timer.profiler.dump_stats(path)
+    return path
+
+
+def _render_panel(record, profile_path):
+    with st.sidebar.expander("Render Timings", expanded=True):
+        st.caption(f"{record['page']}: {record['total']:.3f}s total")
+        st.dataframe(
+            [
+                {
+                    'Section': s['name'],
+                    'Seconds': round(s['seconds'], 3),
+                    'Share': f"{s['seconds'] / record['total']:.0%}" if record['total'] else '-',
+                }
+                for s in sorted(record['sections'], key=lambda s: s['seconds'], reverse=True)
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+        if profile_path:
+            st.caption(f"cProfile written to {profile_path}")
+
+
+def finish_page():
+    """
+    Stops the current timer and reports it as configured by the admin
+    toggles. Called by Report.py after pg.run().
+    """
+    timer = st.session_state.pop(_TIMER_KEY, None)
+    if timer is None:
+        return None
+    timer.close_section()
+    profile_path = None
+    if timer.profiler is not None:
+        timer.profiler.disable()
+        profile_path = _dump_profile(timer)
+    record = timer.as_record()
+    if profile_path:
+        record['profile'] = profile_path
+    if enabled('json_log'):
+        _write_log(record)
+    if enabled('panel'):
+        _render_panel(record, profile_path)
+    return record
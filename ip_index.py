@@ -0,0 +1,286 @@
+"""
+Packed IPv4 addresses and a range index over them.
+
+ingest.py stores ip_address as a uint32, null where the log's value isn't an
+IPv4 address, so distinct counts and grouping work on integers. The in-memory
+frame can't hold nulls in a uint32 column and uses MISSING_IP (0, i.e.
+0.0.0.0, never a customer's address) instead; valid_ips() masks those rows
+out of customer counts and sessions. pack_ips() and unpack_ips() convert
+between the two forms; format_ips() turns a frame's packed column back into
+text for display and export, with missing addresses left blank.
+
+A network (CIDR block or dotted prefix) is a contiguous range of packed
+addresses. IpRangeIndex keeps the log's row positions sorted by address, so
+the rows, requests and distinct customers of any network are found with two
+binary searches instead of a scan, e.g. for internal vs. external traffic.
+With the DuckDB backend the same counts are range filters and group-bys over
+the Parquet store, and the index isn't built.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa  # type: ignore
+import pyarrow.compute as pc  # type: ignore
+import streamlit as st  # type: ignore
+
+IP_COLUMN = 'ip_address'
+IPV4_PATTERN = r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$'
+MISSING_IP = 0
+
+# Named networks for the traffic breakdown; addresses outside all of them are
+# external. The private ranges are RFC 1918's.
+NETWORKS = {
+    'Internal (10.0.0.0/8)': '10.0.0.0/8',
+    'Internal (172.16.0.0/12)': '172.16.0.0/12',
+    'Internal (192.168.0.0/16)': '192.168.0.0/16',
+}
+EXTERNAL = 'External'
+UNKNOWN = 'Unknown address'
+
+
+def pack_ips(values):
+    """
+    Packs dotted IPv4 strings into uint32 values.
+    Args:
+        values (pa.Array | pa.ChunkedArray): String addresses.
+    Returns:
+        pa.Array: uint32 addresses, null where a value isn't a valid IPv4
+        address.
+    """
+    values = pc.utf8_trim_whitespace(values)
+    valid = pc.fill_null(pc.match_substring_regex(values, IPV4_PATTERN), False)
+    values = pc.if_else(valid, values, '0.0.0.0')
+    octets = pc.list_flatten(pc.split_pattern(values, '.'))
+    octets = pc.cast(octets, pa.uint32()).to_numpy().reshape(-1, 4)
+    invalid = (octets > 255).any(axis=1) | ~np.asarray(valid, dtype=bool)
+    octets = np.where(invalid[:, None], 0, octets).astype(np.uint32)
+    packed = (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+    # 0.0.0.0 isn't a customer's address either.
+    return pa.array(packed, type=pa.uint32(), mask=invalid | (packed == MISSING_IP))
+
+
+def valid_ips(values):
+    """
+    Boolean mask of the packed addresses that aren't MISSING_IP.
+    """
+    return np.asarray(values, dtype=np.uint32) != MISSING_IP
+
+
+def unpack_ips(values):
+    """
+    Formats packed uint32 addresses as dotted IPv4 strings.
+    Returns:
+        np.ndarray: object array of strings, None for MISSING_IP.
+    """
+    values = np.asarray(values, dtype=np.uint32)
+    octets = [(values >> shift) & 0xFF for shift in (24, 16, 8, 0)]
+    dotted = pd.Series(octets[0]).astype(str)
+    for octet in octets[1:]:
+        dotted = dotted + '.' + pd.Series(octet).astype(str)
+    dotted = dotted.to_numpy(dtype=object)
+    dotted[~valid_ips(values)] = None
+    return dotted
+
+
+def format_ips(frame):
+    """
+    Returns the frame with a packed ip_address column turned back into text,
+    or the frame itself if it has no packed addresses.
+    """
+    if IP_COLUMN not in frame.columns or frame[IP_COLUMN].dtype != np.uint32:
+        return frame
+    return frame.assign(**{IP_COLUMN: unpack_ips(frame[IP_COLUMN].to_numpy())})
+
+
+def parse_network(text):
+    """
+    First and last packed address of a network.
+    Args:
+        text (str): CIDR block ('10.0.0.0/8'), dotted prefix ('157.20.' or
+            '157.20') or a single address.
+    Returns:
+        tuple: (first, last) as ints, inclusive.
+    Raises:
+        ValueError: If the text isn't a network.
+    """
+    text = text.strip()
+    if '/' in text:
+        address, bits = text.split('/', 1)
+        octets = address.split('.')
+        bits = int(bits)
+    else:
+        octets = [octet for octet in text.rstrip('.').split('.')]
+        bits = 8 * len(octets)
+        octets += ['0'] * (4 - len(octets))
+    if len(octets) != 4 or not 0 <= bits <= 32 or not all(o.isdigit() and int(o) <= 255 for o in octets):
+        raise ValueError(f"Not an IPv4 network: {text!r}")
+    address = 0
+    for octet in octets:
+        address = (address << 8) | int(octet)
+    size = 1 << (32 - bits)
+    first = address & ~(size - 1) & 0xFFFFFFFF
+    return first, first + size - 1
+
+
+class IpRangeIndex:
+    """
+    Row positions of the log sorted by packed address. Rows without an
+    address (MISSING_IP sorts first) are kept apart from every network.
+    """
+    def __init__(self, ips):
+        ips = np.asarray(ips, dtype=np.uint32)
+        order = np.argsort(ips, kind='stable')
+        n_missing = int(np.searchsorted(ips[order], np.uint32(MISSING_IP), side='right'))
+        self.missing = order[:n_missing]
+        self.order = order[n_missing:]
+        self.sorted_ips = ips[self.order]
+        self.n_rows = len(ips)
+
+    def _bounds(self, first, last):
+        start = np.searchsorted(self.sorted_ips, np.uint32(first), side='left')
+        stop = np.searchsorted(self.sorted_ips, np.uint32(last), side='right')
+        return start, stop
+
+    def rows(self, first, last):
+        """
+        Positions (in log order) of the rows with an address in [first, last].
+        """
+        start, stop = self._bounds(first, last)
+        return np.sort(self.order[start:stop])
+
+    def summary(self, first, last, row_mask=None):
+        """
+        Requests and distinct addresses in [first, last], optionally only
+        among the rows selected by a boolean row mask.
+        Returns:
+            tuple: (requests, customers)
+        """
+        start, stop = self._bounds(first, last)
+        ips = self.sorted_ips[start:stop]
+        if row_mask is not None:
+            ips = ips[row_mask[self.order[start:stop]]]
+        if not len(ips):
+            return 0, 0
+        return len(ips), int(np.count_nonzero(ips[1:] != ips[:-1])) + 1
+
+    def breakdown(self, networks=NETWORKS, row_mask=None):
+        """
+        Requests and distinct customers per named network, plus the rest as
+        EXTERNAL and the requests without an address as UNKNOWN.
+        Args:
+            networks (dict): Name -> network text, see parse_network().
+            row_mask (np.ndarray): Optional boolean mask of the rows to count.
+        Returns:
+            pd.DataFrame: network, requests, customers.
+        """
+        records = []
+        for name, network in networks.items():
+            records.append((name, *self.summary(*parse_network(network), row_mask)))
+        requests, customers = self.summary(0, 0xFFFFFFFF, row_mask)
+        # Named networks must not overlap for the remainder to be exact.
+        records.append((
+            EXTERNAL,
+            requests - sum(record[1] for record in records),
+            customers - sum(record[2] for record in records),
+        ))
+        missing = len(self.missing) if row_mask is None else int(np.count_nonzero(row_mask[self.missing]))
+        if missing:
+            records.append((UNKNOWN, missing, 0))
+        return pd.DataFrame(records, columns=['network', 'requests', 'customers'])
+
+    def top_subnets(self, bits=24, n=10, row_mask=None, network=None):
+        """
+        The n busiest subnets of the given prefix length.
+        Args:
+            network (str): Only count addresses in this network, see
+                parse_network().
+        Returns:
+            pd.DataFrame: subnet (CIDR text), requests, customers.
+        """
+        start, stop = self._bounds(*parse_network(network)) if network else (0, len(self.order))
+        ips = self.sorted_ips[start:stop]
+        if row_mask is not None:
+            ips = ips[row_mask[self.order[start:stop]]]
+        subnets = (ips >> np.uint32(32 - bits)) if bits < 32 else ips
+        values, starts, requests = np.unique(subnets, return_index=True, return_counts=True)
+        # ips are sorted, so each subnet's addresses are contiguous.
+        changes = np.concatenate([[True], ips[1:] != ips[:-1]]) if len(ips) else np.zeros(0, dtype=bool)
+        customers = np.add.reduceat(changes.astype(np.int64), starts) if len(starts) else np.zeros(0, dtype=np.int64)
+        top = np.argsort(-requests, kind='stable')[:n]
+        first = values[top].astype(np.uint32) << np.uint32(32 - bits) if bits < 32 else values[top]
+        return pd.DataFrame({
+            'subnet': [f"{address}/{bits}" for address in unpack_ips(first)],
+            'requests': requests[top],
+            'customers': customers[top],
+        })
+
+
+@st.cache_resource(max_entries=1)
+def _ip_index_for_version(version):
+    from data_loader import load_data
+    return IpRangeIndex(load_data()[IP_COLUMN].to_numpy())
+
+
+def get_ip_index():
+    """
+    The range index for the current data version, shared by all pages.
+    """
+    from data_loader import data_version
+    return _ip_index_for_version(data_version())
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _traffic_for_version(version, signature, network, bits):
+    from filter_index import get_filter_index
+    index = _ip_index_for_version(version)
+    rows = get_filter_index().rows(dict(signature))
+    row_mask = None
+    if rows is not None:
+        row_mask = np.zeros(index.n_rows, dtype=bool)
+        row_mask[rows] = True
+    return index.breakdown(row_mask=row_mask), index.top_subnets(bits, row_mask=row_mask, network=network)
+
+
+def get_network_traffic(filters=None, network=None, bits=24):
+    """
+    Internal vs. external traffic and the busiest subnets for the rows
+    matching the filters, cached per data version.
+    Args:
+        filters (dict): The page's sidebar filters.
+        network (str): Only list subnets inside this network.
+        bits (int): Prefix length of the listed subnets.
+    Returns:
+        tuple: (breakdown() DataFrame, top_subnets() DataFrame)
+    Raises:
+        ValueError: If network isn't a valid network.
+    """
+    from data_loader import data_version
+    from filter_index import filter_signature
+    from query_backend import in_memory
+    if network:
+        parse_network(network)
+    if not in_memory():
+        return _backend_traffic(filters, network or None, bits)
+    return _traffic_for_version(data_version(), filter_signature(filters or {}), network or None, bits)
+
+
+def _backend_traffic(filters, network, bits, networks=NETWORKS, n=10):
+    from query_backend import get_backend
+    backend = get_backend()
+    summary = backend.network_summary([parse_network(text) for text in networks.values()], filters)
+    records = [
+        (name, int(summary[f'requests{k}']), int(summary[f'customers{k}'])) for k, name in enumerate(networks)
+    ]
+    records.append((
+        EXTERNAL,
+        int(summary['requests']) - sum(record[1] for record in records),
+        int(summary['customers']) - sum(record[2] for record in records),
+    ))
+    if summary['missing']:
+        records.append((UNKNOWN, int(summary['missing']), 0))
+    subnets = backend.subnet_counts(bits, n, filters, parse_network(network) if network else None)
+    top = pd.DataFrame({
+        'subnet': [f"{address}/{bits}" for address in unpack_ips(subnets['subnet'].to_numpy())],
+        'requests': subnets['requests'].to_numpy(np.int64),
+        'customers': subnets['customers'].to_numpy(np.int64),
+    })
+    return pd.DataFrame(records, columns=['network', 'requests', 'customers']), top
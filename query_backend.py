@@ -0,0 +1,187 @@
+"""
+Common query API for the dashboard's KPIs and charts.
+
+Pages ask a backend for roll-ups of the log under the sidebar filters instead
+of aggregating the frame themselves. Two backends implement it:
+
+    cube     the pre-aggregated AggregateCube built from the in-memory frame
+             (cube.py), the default
+    duckdb   SQL pushed down to an embedded DuckDB scanning the Parquet store
+             (duckdb_backend.py), so aggregation memory doesn't grow with the log
+
+The backend is chosen for the whole server with the DASHBOARD_BACKEND
+environment variable:
+
+    DASHBOARD_BACKEND=duckdb streamlit run Report.py
+
+With the cube, row-level features (the newest rows, exact customer counts)
+use the in-memory frame's indexes. With DuckDB they query the store as well,
+so the frame is never loaded (see in_memory()).
+"""
+import os
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+import streamlit as st  # type: ignore
+
+from data_loader import load_data
+from filter_index import get_filter_index
+from ip_index import valid_ips
+
+BACKENDS = ('cube', 'duckdb')
+BACKEND = os.environ.get('DASHBOARD_BACKEND', 'cube').strip().lower() or 'cube'
+
+# Session state key of the exact unique-customers toggle in Report.py.
+EXACT_UNIQUES = 'exact_unique_customers'
+
+
+class QueryBackend(ABC):
+    """
+    Base class of the query backends. Subclasses implement rollup(), total(),
+    date_range() and distinct_ips(); the other queries are derived from those.
+
+    Filters are dicts of column -> allowed values; a missing column or None
+    means all values. The 'month' dimension is the first day of the month of
+    the sale.
+    """
+    @abstractmethod
+    def rollup(self, by, filters=None):
+        """
+        Rolls the log up to the given dimensions.
+        Returns:
+            pd.DataFrame: 'cost' (sum) and 'count' per observed group, indexed by `by`.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def total(self, filters=None):
+        """
+        Sum of cost and number of rows matching the filters.
+        Returns:
+            pd.Series: 'cost' and 'count'.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def date_range(self, first, last, filters=None):
+        """
+        Sum of cost and number of rows matching the filters sold between two
+        timestamps, inclusive. Only the months in the range are read.
+        Args:
+            first, last (pd.Timestamp): Bounds on date_of_sale.
+        Returns:
+            pd.Series: 'cost' and 'count'.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def distinct_ips(self, filters=None, months=None):
+        """
+        Approximate number of distinct ip_address values.
+        Args:
+            filters (dict): Filters on customer_country and/or salesperson.
+            months (tuple): Optional (first, last) month start timestamps, inclusive.
+        """
+        raise NotImplementedError
+
+    def ranked(self, by, metric='count', filters=None):
+        """
+        One metric per value of a dimension, largest first. Equivalent to
+        value_counts() for 'count' or groupby().sum() sorted for 'cost'.
+        """
+        return self.rollup(by, filters)[metric].sort_values(ascending=False)
+
+    def revenue_by(self, by, filters=None):
+        """
+        Total cost per value of a dimension, largest first.
+        """
+        return self.ranked(by, 'cost', filters)
+
+    def monthly_series(self, metric, filters=None):
+        """
+        One metric per calendar month with empty months filled with 0, like
+        resampling the raw log by month.
+        """
+        series = self.rollup('month', filters)[metric]
+        if series.empty:
+            return series
+        months = pd.date_range(series.index.min(), series.index.max(), freq='MS', name='month')
+        return series.reindex(months, fill_value=0)
+
+
+def year_range(year):
+    """
+    First and last instant of a calendar year, as inclusive date_range() bounds.
+    """
+    return pd.Timestamp(year, 1, 1), pd.Timestamp(year + 1, 1, 1) - pd.Timedelta(1, 'ns')
+
+
+def in_memory(name=None):
+    """
+    Whether the backend is built from the in-memory log frame (load_data()).
+    Args:
+        name (str): 'cube' or 'duckdb', DASHBOARD_BACKEND by default.
+    """
+    return (name or BACKEND) != 'duckdb'
+
+
+def get_backend(name=None):
+    """
+    The query backend for the current data version.
+    Args:
+        name (str): 'cube' or 'duckdb', DASHBOARD_BACKEND by default.
+    """
+    name = name or BACKEND
+    if name == 'duckdb':
+        from duckdb_backend import get_duckdb_backend
+        return get_duckdb_backend()
+    if name == 'cube':
+        from cube import get_cube
+        return get_cube()
+    raise ValueError(f"Unknown query backend {name!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def unique_customers(filters=None, year=None):
+    """
+    Number of distinct ip_address values among the rows matching the filters.
+    Estimated by the cube's HyperLogLog sketches (about 1.6% error), or
+    counted exactly over the matching rows of the in-memory frame when the
+    exact toggle in Report.py is on. DuckDB always counts exactly.
+    Args:
+        filters (dict): Filters on customer_country and/or salesperson.
+        year (int): Only count sales made in this calendar year.
+    Returns:
+        int
+    """
+    if in_memory() and st.session_state.get(EXACT_UNIQUES, False):
+        ips = load_data()['ip_address'].to_numpy()
+        if year is not None:
+            # Only the rows of that year, see date_index.py.
+            from date_index import range_rows
+            ips = ips[range_rows(*year_range(year), filters)]
+        else:
+            index = get_filter_index()
+            ips = index.take(ips, index.rows(filters))
+        return len(np.unique(ips[valid_ips(ips)]))
+    months = None if year is None else (pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 1))
+    return get_backend().distinct_ips(filters, months)
+
+
+def latest_rows(columns, n, filters=None):
+    """
+    The n rows with the latest timestamps among those matching the filters,
+    latest first. Found through the filter index of the in-memory frame, or
+    queried from DuckDB.
+    Args:
+        columns (list): Log columns to return.
+        n (int): Number of rows.
+        filters (dict): Column -> allowed values. Missing or None means all.
+    Returns:
+        pd.DataFrame: ip_address, if requested, stays packed.
+    """
+    if not in_memory():
+        return get_backend().latest(columns, n, filters)
+    df = load_data()
+    index = get_filter_index()
+    return df.take(index.latest(df, index.rows(filters), n))[columns]
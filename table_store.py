@@ -0,0 +1,130 @@
+"""
+Memory-mapped Arrow snapshot of the processed log.
+
+Each data version of the log is written once to an uncompressed Arrow IPC
+(Feather v2) file under TABLE_DIR. Every server process memory-maps that file
+and builds its DataFrame directly on the mapped buffers, so processes on the
+same host share one copy of the log through the page cache instead of each
+holding its own.
+
+For pandas to use the buffers in place, strings are dictionary-encoded with
+the index type pandas uses for the categorical codes (int8 for up to 127
+values, then int16, int32). ip_address is already a packed uint32 in the
+Parquet store (see ip_index.py); its nulls become MISSING_IP, as pandas can
+only adopt a uint32 column without nulls. Use format_ips() to turn it back
+into text for display/export.
+
+Frames built from a snapshot are read-only.
+"""
+import os
+import tempfile
+
+import numpy as np
+import pyarrow as pa  # type: ignore
+import pyarrow.compute as pc  # type: ignore
+import pyarrow.ipc as ipc  # type: ignore
+
+from ip_index import IP_COLUMN, MISSING_IP
+
+TABLE_DIR = 'ai_solutions_web_sales_logs.arrow'
+KEEP_VERSIONS = 2
+
+
+def _index_type(n_values):
+    for index_type in (pa.int8(), pa.int16(), pa.int32()):
+        if n_values <= np.iinfo(index_type.to_pandas_dtype()).max:
+            return index_type
+    return pa.int64()
+
+
+def to_snapshot(*tables):
+    """
+    Concatenates log tables into the snapshot layout: one chunk per column and
+    a single dictionary per string column. Tables already in the snapshot
+    layout can be passed too, so a snapshot can be extended with newly
+    ingested rows.
+    Returns:
+        pa.Table
+    """
+    normalized = []
+    for table in tables:
+        for i, field in enumerate(table.schema):
+            if field.name == IP_COLUMN and field.nullable:
+                table = table.set_column(i, pa.field(IP_COLUMN, field.type, nullable=False),
+                                         pc.fill_null(table.column(i), MISSING_IP))
+            elif pa.types.is_dictionary(field.type):
+                table = table.set_column(i, field.name, table.column(i).cast(pa.dictionary(pa.int32(), pa.string())))
+        normalized.append(table)
+    table = pa.concat_tables(normalized).unify_dictionaries().combine_chunks()
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            column = table.column(i)
+            n_values = len(column.chunk(0).dictionary) if column.num_chunks else 0
+            table = table.set_column(i, field.name, column.cast(pa.dictionary(_index_type(n_values), pa.string())))
+    return table.combine_chunks()
+
+
+def snapshot_path(version, table_dir=TABLE_DIR):
+    return os.path.join(table_dir, f"{version[:32]}.arrow")
+
+
+def write_snapshot(table, path):
+    """
+    Writes a snapshot table as an uncompressed Arrow IPC file, atomically.
+    """
+    table_dir = os.path.dirname(path)
+    os.makedirs(table_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=table_dir, prefix='.', suffix='.tmp')
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def open_snapshot(path):
+    """
+    Memory-maps a snapshot file. The returned table's buffers point into the
+    mapping; nothing is read until it is used.
+    """
+    return ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def _prune(table_dir=TABLE_DIR, keep=KEEP_VERSIONS):
+    files = [os.path.join(table_dir, name) for name in os.listdir(table_dir) if name.endswith('.arrow')]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for path in files[keep:]:
+        try:
+            # Processes still mapping an old version keep their pages.
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def snapshot_table(version, build, table_dir=TABLE_DIR):
+    """
+    The memory-mapped snapshot of a data version, written first by calling
+    build() if no process has done so yet.
+    Args:
+        version (str): data_version() of the log.
+        build (callable): Returns the log as a list of Arrow tables to
+            concatenate with to_snapshot().
+    Returns:
+        pa.Table
+    """
+    path = snapshot_path(version, table_dir)
+    if not os.path.isfile(path):
+        write_snapshot(to_snapshot(*build()), path)
+        _prune(table_dir)
+    return open_snapshot(path)
+
+
+def snapshot_frame(table):
+    """
+    DataFrame over a snapshot table's buffers, without copying the data.
+    """
+    return table.to_pandas(split_blocks=True)
@@ -0,0 +1,187 @@
+"""
+Boot-time cache warmup.
+
+The first run of Report.py in a server process starts a background thread that
+loads everything the pages share before anyone needs it: the Parquet store and
+the log frame, the filter and date-range indexes, the query backend's
+aggregates, the country clusters, the country coordinates, the forecast files,
+the funnel sessions and the IP range index.
+Each step fills the same cache the pages use, so the first user after a deploy sees steady-state
+latency instead of paying for the builds; a page reaching a step that is still
+running simply waits for it. With the DuckDB backend the steps that build on
+the in-memory frame are skipped, as the pages don't load it.
+
+Progress is shown by status_indicator() in the Report.py sidebar. Run directly
+to warm the on-disk artifacts (Parquet store, memory-mapped snapshot, cluster
+results) ahead of a deploy:
+
+    python warmup.py
+"""
+import argparse
+import threading
+import time
+import traceback
+
+import streamlit as st  # type: ignore
+
+
+def _log_data():
+    from data_loader import load_data
+    load_data()
+
+
+def _filter_index():
+    from filter_index import get_filter_index
+    get_filter_index()
+
+
+def _date_index():
+    from date_index import get_date_index
+    get_date_index()
+
+
+def _aggregates():
+    from query_backend import get_backend
+    get_backend().total()
+
+
+def _clusters():
+    from clustering import get_region_clusters
+    get_region_clusters()
+
+
+def _coordinates():
+    from geocode import get_country_latlon
+    from query_backend import get_backend
+    for country in get_backend().rollup('customer_country').index:
+        get_country_latlon(country)
+
+
+def _forecasts():
+    from forecasting import load_monthly, load_weekly
+    from query_backend import get_backend
+    load_monthly()
+    load_weekly()
+    for salesperson in get_backend().rollup('salesperson').index:
+        load_monthly(salesperson)
+
+
+def _funnels():
+    from funnels import FUNNELS, get_funnel
+    for name in FUNNELS:
+        get_funnel(name)
+
+
+def _ip_index():
+    from ip_index import get_network_traffic
+    get_network_traffic()
+
+
+# (name, function) in run order; later steps reuse what earlier ones loaded.
+STEPS = [
+    ('Log data', _log_data),
+    ('Filter index', _filter_index),
+    ('Date index', _date_index),
+    ('Aggregates', _aggregates),
+    ('Country clusters', _clusters),
+    ('Country coordinates', _coordinates),
+    ('Forecasts', _forecasts),
+    ('Funnels', _funnels),
+    ('IP range index', _ip_index),
+]
+
+# Steps that build on the in-memory log frame; skipped when the query backend
+# doesn't use it (see query_backend.in_memory()).
+FRAME_STEPS = {'Log data', 'Filter index', 'Date index'}
+
+
+class Warmup:
+    """
+    Runs the warmup steps once, in a background thread, and records how each
+    one went.
+    """
+    def __init__(self, steps=STEPS):
+        self.steps = steps
+        self.status = {name: 'pending' for name, _ in steps}
+        self.durations = {}
+        self.errors = {}
+        self.started = None
+        self.finished = None
+        self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def run(self):
+        from query_backend import in_memory
+        self.started = time.time()
+        frame = in_memory()
+        for name, step in self.steps:
+            if name in FRAME_STEPS and not frame:
+                self.status[name] = 'skipped'
+                continue
+            self.status[name] = 'running'
+            start = time.time()
+            try:
+                step()
+                self.status[name] = 'ready'
+            except Exception:
+                # A failed step leaves the cache cold; the page will retry it.
+                self.status[name] = 'failed'
+                self.errors[name] = traceback.format_exc(limit=3)
+            self.durations[name] = time.time() - start
+        self.finished = time.time()
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def ready(self):
+        return self.done and not self.errors
+
+
+@st.cache_resource
+def start_warmup():
+    """
+    Starts the warmup thread on the first call in a server process and
+    returns it; later calls return the same Warmup.
+    """
+    return Warmup().start()
+
+
+def status_indicator(warmup):
+    """
+    Sidebar health indicator: warming up, ready or degraded, with the steps.
+    """
+    total = len(warmup.steps)
+    ready = sum(state in ('ready', 'skipped') for state in warmup.status.values())
+    if not warmup.done:
+        label, state = f"Warming up caches ({ready}/{total})", 'running'
+    elif warmup.ready:
+        label, state = f"Caches ready ({warmup.finished - warmup.started:.1f}s)", 'complete'
+    else:
+        label, state = f"Warmup failed for {len(warmup.errors)} of {total} steps", 'error'
+    with st.sidebar.status(label, state=state, expanded=False):
+        for name, _ in warmup.steps:
+            duration = warmup.durations.get(name)
+            timing = f" ({duration:.2f}s)" if duration is not None else ""
+            st.write(f"{name}: {warmup.status[name]}{timing}")
+            if name in warmup.errors:
+                st.code(warmup.errors[name])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+    warmup = Warmup()
+    warmup.run()
+    for name, _ in warmup.steps:
+        if name not in warmup.durations:
+            print(f"{name}: {warmup.status[name]}")
+            continue
+        print(f"{name}: {warmup.status[name]} in {warmup.durations[name]:.2f}s")
+        if name in warmup.errors:
+            print(warmup.errors[name])
+    print(f"Warmed up in {warmup.finished - warmup.started:.2f}s")